@@ -0,0 +1,125 @@
+import envs.battle_env as battle_env
+import envs.scenarios as scenarios
+from evaluate import OUTCOMES, load_model, init_worker, play_scenarios
+import multiprocessing as mp
+import numpy as np
+import math
+import os
+import sys
+import time
+
+# Compares two models on the same scenarios (common random numbers): both models play every scenario seed, so
+# the luck of the starting positions cancels out of the difference and fewer games are needed than when
+# each model is evaluated on its own random games
+
+compare_config = {
+    'max_games': 4000, # Most scenarios to play (each is played by both models)
+    'min_games': 200, # Scenarios before stopping early is allowed
+    'target_width': 0.04, # Stop once the interval of the win rate difference is narrower than this
+    'z': 1.96, # z-score of the confidence interval (1.96 is 95%)
+    'games_per_task': 25, # Scenarios a worker plays before reporting back
+    'n_workers': os.cpu_count(), # Worker processes
+    'suite_version': scenarios.SUITE_VERSION # Scenario suite, see envs/scenarios.py
+}
+
+def paired_interval(wins_a, wins_b, z=1.96):
+    """Confidence interval of the difference between two win rates measured on the same scenarios
+
+    Args:
+        wins_a (np.array): 1 where model A won the scenario, else 0
+        wins_b (np.array): 1 where model B won the scenario, else 0
+        z (float, optional): z-score of the interval. Defaults to 1.96.
+
+    Returns:
+        float: Win rate of A minus win rate of B
+        float: Lower bound
+        float: Upper bound
+        float: Games independent evaluations would need per paired game for the same width
+    """
+    n = len(wins_a)
+    diffs = wins_a - wins_b
+    mean = diffs.mean()
+    variance = diffs.var(ddof=1) if n > 1 else 1.0
+    half_width = z * math.sqrt(variance / n)
+
+    # Variance of the difference if the models had played independent games
+    p_a, p_b = wins_a.mean(), wins_b.mean()
+    unpaired = p_a * (1 - p_a) + p_b * (1 - p_b)
+    return mean, mean - half_width, mean + half_width, unpaired / variance if variance > 0 else math.inf
+
+def compare(env_config, models, config):
+    """Plays both models on the scenario suite until max_games, or until the interval is narrower than target_width
+
+    Args:
+        env_config (dict): Keyword arguments for battle_env.parallel_env
+        models (list): (actors, noise_scale) of the two models
+        config (dict): Settings like compare_config
+
+    Returns:
+        np.array: [2, n_games] index in OUTCOMES of each game's winner, in suite order
+    """
+    seeds = scenarios.scenario_seeds(config['max_games'], config['suite_version'])
+    blocks = [seeds[i:i + config['games_per_task']] for i in range(0, len(seeds), config['games_per_task'])]
+    outcomes = []
+    start = time.perf_counter()
+
+    ctx = mp.get_context('spawn') # The parent has torch loaded, which isn't safe to fork
+    with ctx.Pool(config['n_workers'], initializer=init_worker, initargs=(env_config, models)) as pool:
+        # In order, so the games played are always the start of the suite, even when stopping early
+        for block in pool.imap(play_scenarios, blocks):
+            outcomes.append(block)
+            wins = (np.concatenate(outcomes, axis=1) == OUTCOMES.index('red')).astype(np.float64)
+            n = wins.shape[1]
+
+            diff, low, high, ratio = paired_interval(wins[0], wins[1], config['z'])
+            elapsed = time.perf_counter() - start
+            sys.stdout.write(f'\r{n} scenarios | A {wins[0].mean():.3f} | B {wins[1].mean():.3f} | A - B {diff:+.3f} [{low:+.3f}, {high:+.3f}] | {n / elapsed:.1f} scenarios/s ') # Will overwrite the previous line
+            sys.stdout.flush()
+
+            if n >= config['min_games'] and high - low <= config['target_width']:
+                print(f'\nThe interval is narrower than {config["target_width"]}, stopping early')
+                break
+        else:
+            print()
+        # Leaving the with block terminates the workers that are still playing
+    return np.concatenate(outcomes, axis=1)
+
+def main():
+    folders = []
+    for name in ('A', 'B'):
+        model_name = input(f'Enter model {name} name: ')
+        FOLDER = f'models/{model_name}'
+        if not os.path.exists(FOLDER):
+            print('Model does not exist')
+            sys.exit()
+        folders.append(FOLDER)
+
+    loaded = [load_model(FOLDER) for FOLDER in folders]
+    env_config = loaded[0][0]
+    if any(config['n_agents'] != env_config['n_agents'] or config['continuous_actions'] != env_config['continuous_actions'] for config, _, _ in loaded):
+        print('The models play different games (n_agents or continuous_actions differ)')
+        sys.exit()
+    models = [(actors, noise_scale) for _, actors, noise_scale in loaded]
+
+    # The fingerprint changes if the spawn rules change, so results are only comparable when it matches
+    env = battle_env.parallel_env(**dict(env_config, show=False))
+    suite = f"v{compare_config['suite_version']} ({scenarios.fingerprint(env, scenarios.scenario_seeds(100, compare_config['suite_version']))})"
+    print(f'Scenario suite {suite}')
+
+    start = time.perf_counter()
+    outcomes = compare(env_config, models, compare_config)
+    elapsed = time.perf_counter() - start
+    wins = (outcomes == OUTCOMES.index('red')).astype(np.float64)
+    n = wins.shape[1]
+    diff, low, high, ratio = paired_interval(wins[0], wins[1], compare_config['z'])
+
+    print(f'{n} scenarios per model in {elapsed:.1f} s')
+    for name, FOLDER, model_outcomes in zip(('A', 'B'), folders, outcomes):
+        rates = ', '.join(f'{outcome} {np.mean(model_outcomes == idx):.2%}' for idx, outcome in enumerate(OUTCOMES))
+        print(f'{name} ({FOLDER}): {rates}')
+    print(f'Red win rate A - B: {diff:+.2%} ({low:+.2%} - {high:+.2%})')
+    if math.isfinite(ratio):
+        print(f'Independent games would need {ratio:.1f}x as many games for this interval')
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,15 @@
-from envs.sprites import Plane, Base, Bullet, Explosion
-import envs.sprites as sprites
-import pygame
-from pygame.locals import *
+from envs.core import PlaneState, BaseState, BulletPool
+import envs.core as core
 import numpy as np
 import math
+import random
 from gym import spaces
 from gym.utils import EzPickle
 import os
 from pettingzoo import ParallelEnv
 from pettingzoo.utils import wrappers
 from pettingzoo.utils import parallel_to_aec
-import vidmaker
-import cv2
+# pygame, the sprites, and the video libraries are only imported when rendering so training never needs a display or SDL
 os.environ['KMP_DUPLICATE_LIB_OK']='True' # Needed or else it sometimes causes issues on windows machines
 
 def env(**kwargs):
@@ -34,29 +32,6 @@ def raw_env(**kwargs):
     env = parallel_to_aec(env)
     return env
 
-# ---------- HELPER FUNCTIONS -----------
-def rel_angle(p0, a0, p1):
-    """
-    Calculates the relative angle of position1 based on the angle0 and position0
-    Returns the calculated value in degrees
-    ** Don't ask me how the math works I spent hours stealing code to get it to work **
-    """    
-    dx = p0[0] - p1[0]
-    dy = p0[1] - p1[1]
-    rads = math.atan2(dy,dx)
-    rads %= 2*math.pi
-    degs = math.degrees(rads)
-    rel_angle = 180 + a0 - (360 - degs)
-    if rel_angle < -180: rel_angle += 360
-    if rel_angle > 180: rel_angle -= 360
-    return rel_angle
-
-def dist(p1,p0):
-    """
-    Returns the distance between two points
-    """    
-    return math.sqrt((p1[0]-p0[0])**2 + (p1[1]-p0[1])**2)
-
 # ----------- BATTLE ENVIRONMENT -----------
 class parallel_env(ParallelEnv, EzPickle):
     """PettingZoo Environment taking parallel actions
@@ -66,11 +41,11 @@ class parallel_env(ParallelEnv, EzPickle):
     """
 
     metadata = {
-        "render_modes": ["human"],
+        "render_modes": ["human", "offscreen"],
         "name": "battle_env_v1"
     }
 
-    def __init__(self, n_agents=1, show=False, hit_base_reward=100, hit_plane_reward=10, miss_punishment=-1, die_punishment=-5, lose_punishment=-20, fps=20, continuous_actions=False):
+    def __init__(self, n_agents=1, show=False, hit_base_reward=100, hit_plane_reward=10, miss_punishment=-1, die_punishment=-5, lose_punishment=-20, fps=20, continuous_actions=False, seed=None, render_mode='human'):
         """Initializes values, observation spaces, action spaces, etc.
 
         Args:
@@ -81,11 +56,14 @@ class parallel_env(ParallelEnv, EzPickle):
             miss_punishment (int, optional): Punishment value for missing a bullet. Defaults to 0.
             die_punishment (int, optional): Punishment value for plane dying. Defaults to -3.
             fps (int, optional): Framerate for pygame visualization to run at. Defaults to 20.
+            seed (int, optional): Seeds the env's own random number generator. Defaults to None (the global random module).
+            render_mode (string, optional): 'human' shows a window at fps, 'offscreen' draws to a plain surface as fast as possible (no display needed). Defaults to 'human'.
         """
         EzPickle.__init__(self)
         self.n_agents = n_agents # n agents per team
 
-        pygame.init() # Initialize pygame module
+        # Spawns and bullet spread come from self.rng, which is the global random module until a seed is given
+        self.rng = random.Random(seed) if seed is not None else random
 
         # Set the hitpoints for the planes and bases
         self.base_hp = 5 * self.n_agents
@@ -95,8 +73,8 @@ class parallel_env(ParallelEnv, EzPickle):
         self.team = {}
         self.team['red'] = {}
         self.team['blue'] = {}
-        self.team['red']['base'] = Base('red', self.base_hp)
-        self.team['blue']['base'] = Base('blue', self.base_hp)
+        self.team['red']['base'] = BaseState('red', self.base_hp, self.rng)
+        self.team['blue']['base'] = BaseState('blue', self.base_hp, self.rng)
         self.team['red']['planes'] = {}
         self.team['blue']['planes'] = {}
         self.team['red']['wins'] = 0
@@ -107,15 +85,16 @@ class parallel_env(ParallelEnv, EzPickle):
         self.possible_red = self.possible_agents[:self.n_agents]
         self.possible_blue = self.possible_agents[self.n_agents:]
         self.agents = self.possible_agents[:]
+        self.agent_idx = {agent: idx for idx, agent in enumerate(self.possible_agents)} # Slot of each agent in the arrays
 
         # Creates the planes and makes a map so that they are easier to find
         self.team_map = {}
         for x in self.possible_red:
             self.team_map[x] = 'red'
-            self.team['red']['planes'][x] = Plane('red', self.plane_hp, x)
+            self.team['red']['planes'][x] = PlaneState('red', self.plane_hp, x, self.rng)
         for x in self.possible_blue:
             self.team_map[x] = 'blue'
-            self.team['blue']['planes'][x] = Plane('blue', self.plane_hp, x)
+            self.team['blue']['planes'][x] = PlaneState('blue', self.plane_hp, x, self.rng)
 
         """
         Observation space contains the following:
@@ -163,18 +142,23 @@ class parallel_env(ParallelEnv, EzPickle):
         
         # ---------- Initialize values ----------
         self.continuous_actions = continuous_actions
-        self.width = sprites.DISP_WIDTH
-        self.height = sprites.DISP_HEIGHT
+        self.width = core.DISP_WIDTH
+        self.height = core.DISP_HEIGHT
+        self.diagonal = math.sqrt(math.pow(self.width, 2) + math.pow(self.height, 2)) # Used to normalize distances
         self.max_time = 10 + (self.n_agents * 2)
         self.total_games = 0
         self.ties = 0
-        self.bullets = []
         self.explosions = []
         self.bullet_speed = 450 # mph
         self.shot_dist = 500 # Distance a bullet can travel before it disappears
         self.total_time = 0 # in hours
         self.time_step = 0.1 # hours per time step
+
+        # A bullet lives for at most ceil(shot_dist / distance per step) steps, so a plane can never own more bullets than that
+        bullet_life = int(math.ceil(self.shot_dist / (self.bullet_speed * self.time_step)))
+        self.bullets = BulletPool(len(self.possible_agents) * bullet_life, self.bullet_speed, self.shot_dist)
         self.show = show # show the pygame animation
+        self.render_mode = render_mode # 'human' or 'offscreen'
         self.hit_base_reward = hit_base_reward
         self.hit_plane_reward = hit_plane_reward
         self.miss_punishment = miss_punishment
@@ -182,6 +166,21 @@ class parallel_env(ParallelEnv, EzPickle):
         self.lose_punishment = lose_punishment
         self.fps = fps
         self.recording = False
+        self.trajectory = None # TrajectoryRecorder of the current game, see start_trajectory
+        self.rendering = False
+        self.display = None
+
+        # Preallocated buffers for step_arrays, there are two observation buffers so the last observations stay valid
+        self.obs_bufs = np.zeros((2, len(self.possible_agents), self.obs_size), dtype=np.float32)
+        self.obs_flip = 0
+        self.reward_buf = np.zeros(len(self.possible_agents), dtype=np.float64)
+        self.done_buf = np.zeros(len(self.possible_agents), dtype=bool)
+
+        # Plane state gathered into arrays for the vectorized observations and bullet hits
+        self.plane_team = np.repeat(np.arange(2), self.n_agents) # 0 for red, 1 for blue
+        self.plane_xy = np.zeros((len(self.possible_agents), 2))
+        self.plane_dir = np.zeros(len(self.possible_agents))
+        self.plane_alive = np.zeros(len(self.possible_agents), dtype=bool)
 
     def observation_space(self, agent):
         """Gets the observation space for a given agent
@@ -208,54 +207,58 @@ class parallel_env(ParallelEnv, EzPickle):
         Returns:
             observation (np.array): Contains the values of an observation for the agent
         """
+        return self.observe_all()[self.possible_agents.index(agent)]
 
-        agent_team = self.team_map[agent]
+    def observe_all(self, out=None):
+        """Builds the observations of every agent in one pass
 
-        # Sets default values that will be changed if the planes are alive
-        obs = -np.ones(self.obs_size, dtype=np.float32)
-
-        if not (agent in self.agents and agent in self.team[agent_team]['planes']): # If this plane (the one observing) is dead
-            return obs
+        Args:
+            out (np.array, optional): Array to write the observations into. Defaults to None.
 
-        # Gathers values for observing
-        agent_plane = self.team[agent_team]['planes'][agent]
-        ocolor = 'blue' if agent_team == 'red' else 'red'
-        oplane_ids = self.possible_blue if ocolor == 'blue' else self.possible_red
-        agent_pos = agent_plane.get_pos()
-        agent_dir = agent_plane.get_direction()
-        obase = self.team[ocolor]['base']
-        obase_pos = obase.get_pos()
+        Returns:
+            observations (np.array): [n_agents * 2, obs_size] observations in the order of self.possible_agents
+        """
+        self.plane_arrays()
+        return core.observe_all(self.plane_xy, self.plane_dir, self.plane_alive, self.base_arrays(), self.diagonal, out=out)
 
-        # Values for enemy base
-        obs[0] = dist(agent_pos, obase_pos) / (math.sqrt(math.pow(self.width, 2) + math.pow(self.height, 2))) * 2 - 1
-        obs[1] = rel_angle(agent_pos, agent_dir, obase_pos) / 360
-        index = 2
+    def plane_arrays(self):
+        """
+        Gathers the position, direction, and whether it is alive of every plane into self.plane_xy, self.plane_dir, and self.plane_alive
+        """
+        self.plane_alive.fill(False)
+        for idx, agent in enumerate(self.possible_agents):
+            plane = self.team[self.team_map[agent]]['planes'].get(agent)
+            if plane is not None and agent in self.agents: # If that plane is alive
+                self.plane_xy[idx] = plane.get_pos()
+                self.plane_dir[idx] = plane.get_direction()
+                self.plane_alive[idx] = True
 
-        # Values for each enemy plane
-        for id in oplane_ids:
-            if id in self.agents: # if that plane is alive
-                plane = self.team[self.team_map[id]]['planes'][id]
-                plane_pos = plane.get_pos()
-                obs[index] = 1 # Plane is alive
-                obs[index + 1] = dist(agent_pos, plane_pos) / (math.sqrt(math.pow(self.width, 2) + math.pow(self.height, 2))) * 2 - 1 # Distance to plane
-                obs[index + 2] = rel_angle(agent_pos, agent_dir, plane_pos) / 360 # Angle to plane
-            index += 3
+    def base_arrays(self):
+        """Gathers the positions of the bases
 
-        return np.array(obs, dtype=np.float32) # Cast the dict to np.array 
+        Returns:
+            list: [red base center, blue base center]
+        """
+        return [self.team['red']['base'].get_pos(), self.team['blue']['base'].get_pos()]
 
-    def reset(self, seed=None, return_info=False, options=None):
+    def reset_arrays(self, seed=None, options=None):
         """Reset all of the values so that the game can be restarted
 
+        Args:
+            seed (int, optional): Reseeds the env's random number generator, so the same seed gives the same game. Defaults to None.
+
         Returns:
-            observations (dict): Initial observations of each agent
+            observations (np.array): [n_agents * 2, obs_size] initial observations, indexed like self.possible_agents
         """
+        if seed is not None:
+            self.rng = random.Random(seed)
         
         # Reset the winner
         self.winner = 'none'
 
         # Reset the bases
-        self.team['red']['base'].reset()
-        self.team['blue']['base'].reset()
+        self.team['red']['base'].reset(self.rng)
+        self.team['blue']['base'].reset(self.rng)
 
         # Delete all of the planes
         self.team['red']['planes'].clear()
@@ -263,54 +266,56 @@ class parallel_env(ParallelEnv, EzPickle):
 
         # Re-populate the planes in the team dicts
         for x in self.possible_red:
-            self.team['red']['planes'][x] = Plane('red', self.plane_hp, x)
+            self.team['red']['planes'][x] = PlaneState('red', self.plane_hp, x, self.rng)
         for x in self.possible_blue:
-            self.team['blue']['planes'][x] = Plane('blue', self.plane_hp, x)
+            self.team['blue']['planes'][x] = PlaneState('blue', self.plane_hp, x, self.rng)
 
-        self.display = pygame.Surface((self.width, self.height)) # Reset the pygame display
         self.total_time = 0 # Reset the time
-        self.bullets = [] # Clear all of the bullets
+        self.bullets.clear() # Clear all of the bullets
         self.rendering = False # Not currently rendering (used to initiate display)
         self.agents = self.possible_agents[:] # Resetting all agents alive
-        self.dones = {agent: False for agent in self.possible_agents} # No agents are currently done
+        self.done_buf.fill(False) # No agents are currently done
         self.env_done = False # Environment is not done
 
-        observations = {agent: self.observe(agent) for agent in self.possible_agents} # Get observations for each agent
-        return observations
+        return self.observe_all(out=self.next_obs_buf()) # Get observations for each agent
 
-    def step(self, actions):
+    def reset(self, seed=None, return_info=False, options=None):
+        """Reset all of the values so that the game can be restarted
+
+        Returns:
+            observations (dict): Initial observations of each agent
+        """
+        return self.to_dict(self.reset_arrays(seed, options).copy())
+
+    def step_arrays(self, actions):
         """Takes steps for each agent
 
+        The returned arrays are preallocated and reused: rewards and dones are overwritten by the next step,
+        and the observation buffer alternates so that the previous observations stay valid for one more step.
+
         Args:
-            actions (dict): Dictionary containing the actions of each agent
+            actions (np.array): [n_agents * 2] discrete actions or [n_agents * 2, n_actions] action vectors, indexed like self.possible_agents
+                                None means no actions were passed (ends the game in a tie)
 
         Returns:
-            observations (dict): Dictionary containing the observation of each agent
-            rewards (dict): Dictionary containing the rewards of each agent
-            dones (dict): Dictionary indicating which agents are done and should be skipped over
-            infos (dict): Used for extra info (not utilized)
+            observations (np.array): [n_agents * 2, obs_size] observation of each agent
+            rewards (np.array): [n_agents * 2] rewards of each agent
+            dones (np.array): [n_agents * 2] which agents are done and should be skipped over
         """
 
-        # clip the actions to the action space
-        if self.continuous_actions:
-            for key, value in actions.items():
-                actions[key] = np.clip(value, self.action_space(key).low, self.action_space(key).high)
-
         # Initialize all rewards to 0
-        rewards = {agent: 0 for agent in self.possible_agents}
+        rewards = self.reward_buf
+        rewards.fill(0)
 
-        # If env is done just return some empty info
+        # If env is done just return the observations
         if self.env_done:
-            observations = {agent: self.observe(agent) for agent in self.possible_agents} # Get observation for each agent
-            infos = {agent: {} for agent in self.possible_agents} # Empty info for each agent
-            return observations, rewards, self.dones, infos 
+            return self.observe_all(out=self.next_obs_buf()), rewards, self.done_buf
 
         # If passing no actions or no agents alive, then we have a tie because all agents are dead
-        if len(actions) == 0 or len(self.agents) == 0:
+        if actions is None or len(self.agents) == 0:
             self.tie()
-            observations = {agent: self.observe(agent) for agent in self.possible_agents} # Get observation for each agent
-            infos = {agent: {} for agent in self.possible_agents} # Empty info for each agent
-            return observations, rewards, self.dones, infos 
+            self.record_step(actions, rewards)
+            return self.observe_all(out=self.next_obs_buf()), rewards, self.done_buf
 
         # Increment time
         self.total_time += self.time_step
@@ -318,67 +323,128 @@ class parallel_env(ParallelEnv, EzPickle):
         # Check for tie
         if self.total_time >= self.max_time: # If over the max time
             self.tie()
-            observations = {agent: self.observe(agent) for agent in self.possible_agents} # Get observation for each agent
-            infos = {agent: {} for agent in self.possible_agents} # Empty info for each agent
-            return observations, rewards, self.dones, infos
+            self.record_step(actions, rewards)
+            return self.observe_all(out=self.next_obs_buf()), rewards, self.done_buf
+
+        # clip the actions to the action space
+        if self.continuous_actions:
+            actions = np.clip(actions, -1, 1)
 
         for agent_id in self.agents: # Carry out actions for each agent that is alive
-            action = actions[agent_id] # Grab action for this agent 
-            if type(action) == np.ndarray and not self.continuous_actions: # If the action is a numpy array and the action space is discrete
+            action = actions[self.agent_idx[agent_id]] # Grab action for this agent 
+            if not self.continuous_actions and np.ndim(action) > 0: # If the action is a vector and the action space is discrete
                 action = np.argmax(action)
             self.process_action(action, agent_id) # Perform the action
 
         # Move every bullet and check for hits
-        for bullet in self.bullets[:]:
-            # Move bullet and gather outcome
-            outcome = bullet.update(self.width, self.height, self.time_step)
-
-            # Kill bullet if miss
-            if outcome == 'miss':
-                rewards[bullet.agent_id] += self.miss_punishment # Issue punishment for missing
-                self.bullets.remove(bullet) # Kill the bullet
-
-            # Kill bullet and provide reward if hits base
-            elif isinstance(outcome, Base):
-                outcome.hit() # Damage the base 
-                rewards[bullet.agent_id] += self.hit_base_reward # Issue the reward for hitting
-                self.bullets.remove(bullet) # Kill the bullet
-            
-            # Kill bullet and provide reward if hits plane
-            elif isinstance(outcome, Plane):
-                outcome.hit() # Damage the plane
-                rewards[bullet.agent_id] += self.hit_plane_reward # Issue reward for hitting plane
-                self.bullets.remove(bullet) # Kill the bullet
-
-                # Plane is dead
-                if not outcome.alive:
-                    if self.show:
-                        self.explosions.append(Explosion(outcome.get_pos())) # Create an explosion
-                    self.agents.remove(outcome.id) # Remove the agent from self.agents
-                    self.team[outcome.team]['planes'].pop(outcome.id) # Remove the plane from its team
-                    rewards[outcome.id] += self.die_punishment # Issue punishment for dying
-                    self.dones[outcome.id] = True # Set that agent's done to True
+        self.plane_arrays()
+        miss, base_hit, plane_hit, candidates = self.bullets.update(self.width, self.height, self.time_step, self.base_arrays(), self.plane_xy, self.plane_alive, self.plane_team)
+
+        # Kill bullets that miss
+        np.add.at(rewards, self.bullets.owner[miss], self.miss_punishment) # Issue punishment for missing
+        self.bullets.kill(miss)
+
+        # Kill bullets and provide reward if they hit a base
+        for slot in base_hit:
+            self.team[core.TEAMS[1 - self.bullets.team[slot]]]['base'].hit() # Damage the base
+        np.add.at(rewards, self.bullets.owner[base_hit], self.hit_base_reward) # Issue the reward for hitting
+        self.bullets.kill(base_hit)
+
+        # Kill bullets and provide reward if they hit a plane
+        # Resolved oldest bullet first since a plane killed by one bullet can't be hit by a later one
+        for slot, candidate in zip(plane_hit, candidates):
+            targets = np.flatnonzero(candidate & self.plane_alive)
+            if len(targets) == 0: # Its target already died this step, so the bullet keeps flying
+                continue
+            outcome = self.team[core.TEAMS[self.plane_team[targets[0]]]]['planes'][self.possible_agents[targets[0]]]
+            outcome.hit() # Damage the plane
+            rewards[self.bullets.owner[slot]] += self.hit_plane_reward # Issue reward for hitting plane
+            self.bullets.kill(np.array([slot])) # Kill the bullet
+
+            # Plane is dead
+            if not outcome.alive:
+                if self.show:
+                    from envs.sprites import Explosion
+                    self.explosions.append(Explosion(outcome.get_pos())) # Create an explosion
+                if self.trajectory is not None:
+                    self.trajectory.died(targets[0]) # Same order as the explosions
+                self.agents.remove(outcome.id) # Remove the agent from self.agents
+                self.team[outcome.team]['planes'].pop(outcome.id) # Remove the plane from its team
+                self.plane_alive[targets[0]] = False
+                rewards[targets[0]] += self.die_punishment # Issue punishment for dying
+                self.done_buf[targets[0]] = True # Set that agent's done to True
         
         # Check if red won game
         if not self.team['blue']['base'].alive:
-            for plane in self.possible_red:
-                rewards[plane] += self.lose_punishment
+            rewards[:self.n_agents] += self.lose_punishment
             self.win('red')
 
         # Check if blue won game
         if not self.team['red']['base'].alive:
-            for plane in self.possible_blue:
-                rewards[plane] += self.lose_punishment
+            rewards[self.n_agents:] += self.lose_punishment
             self.win('blue')
 
         # Render the environment
         if self.show:
             self.render()
+        self.record_step(actions, rewards)
         
-        observations = {agent: self.observe(agent) for agent in self.possible_agents}
-        infos = {agent: {} for agent in self.possible_agents}
-        
-        return observations, rewards, self.dones, infos
+        return self.observe_all(out=self.next_obs_buf()), rewards, self.done_buf
+
+    def step(self, actions):
+        """Takes steps for each agent
+
+        Args:
+            actions (dict): Dictionary containing the actions of each agent
+
+        Returns:
+            observations (dict): Dictionary containing the observation of each agent
+            rewards (dict): Dictionary containing the rewards of each agent
+            dones (dict): Dictionary indicating which agents are done and should be skipped over
+            infos (dict): Used for extra info (not utilized)
+        """
+        observations, rewards, dones = self.step_arrays(self.to_array(actions) if len(actions) > 0 else None)
+        infos = {agent: {} for agent in self.possible_agents} # Empty info for each agent
+        return self.to_dict(observations.copy()), self.to_dict(rewards.tolist()), self.to_dict(dones.tolist()), infos
+
+    def to_array(self, actions):
+        """Turns a dictionary of actions into an array indexed like self.possible_agents
+
+        Args:
+            actions (dict): Dictionary containing the actions of each agent (agents without an action do nothing)
+
+        Returns:
+            np.array: [n_agents * 2] discrete actions or [n_agents * 2, n_actions] continuous actions
+        """
+        if self.continuous_actions:
+            array = np.zeros((len(self.possible_agents), self.n_actions), dtype=np.float64)
+            for agent, action in actions.items():
+                array[self.agent_idx[agent]] = np.reshape(action, self.n_actions)
+        else:
+            array = np.zeros(len(self.possible_agents), dtype=np.int64)
+            for agent, action in actions.items():
+                array[self.agent_idx[agent]] = np.argmax(action) if np.ndim(action) > 0 else action
+        return array
+
+    def to_dict(self, values):
+        """Turns anything indexed like self.possible_agents into a dictionary keyed by agent
+
+        Args:
+            values (np.array or list): Values for each agent
+
+        Returns:
+            dict: Value of each agent
+        """
+        return {agent: values[idx] for idx, agent in enumerate(self.possible_agents)}
+
+    def next_obs_buf(self):
+        """Flips between the two preallocated observation buffers
+
+        Returns:
+            np.array: [n_agents * 2, obs_size] buffer to write the next observations into
+        """
+        self.obs_flip ^= 1
+        return self.obs_bufs[self.obs_flip]
     
     def process_action(self, action, agent_id):
         """Processes an action for a single agent
@@ -393,7 +459,6 @@ class parallel_env(ParallelEnv, EzPickle):
         # Get some info about the agent
         team = 'red' if agent_id in self.team['red']['planes'] else 'blue'
         agent = self.team[team]['planes'][agent_id]
-        oteam = 'blue' if team == 'red' else 'red'
         agent_pos = agent.get_pos()
         agent_dir = agent.get_direction()
         if not self.continuous_actions:
@@ -403,7 +468,7 @@ class parallel_env(ParallelEnv, EzPickle):
 
             # --------------- SHOOT ---------------
             elif action == 1:
-                self.bullets.append(Bullet(agent_pos[0], agent_pos[1], agent_dir, self.bullet_speed, team, self.team[oteam], agent_id, self.shot_dist)) # Shoot a bullet
+                self.bullets.spawn(agent_pos[0], agent_pos[1], agent_dir, self.agent_idx[agent_id], core.TEAMS.index(team), self.rng) # Shoot a bullet
                 agent.forward(self.speed, self.time_step) # Move the plane forward
             
             # --------------- TURN LEFT ---------------
@@ -421,30 +486,24 @@ class parallel_env(ParallelEnv, EzPickle):
             turn_angle = action[1] * self.max_turn # Calculate angle to turn from input
             agent.rotate(turn_angle) # Rotate
             if action[2] > 0: # Check if shoot
-                self.bullets.append(Bullet(agent_pos[0], agent_pos[1], agent_dir, self.bullet_speed, team, self.team[oteam], agent_id, self.shot_dist)) # Shoot a bullet
+                self.bullets.spawn(agent_pos[0], agent_pos[1], agent_dir, self.agent_idx[agent_id], core.TEAMS.index(team), self.rng) # Shoot a bullet
             
     def winner_screen(self):
         """
         Display the winner of the game when the game is over
         """
         if self.show: # Makes sure that we are visualizing
-            font = pygame.font.Font(pygame.font.get_default_font(), 32)
-            if self.winner != 'none' and self.winner != 'tie':
-                text = font.render(f"THE WINNER IS {self.winner.upper()}", True, sprites.BLACK)
-                textRect = text.get_rect()
-                textRect.center = (self.width//2, self.height//2)
-            else:
-                text = font.render(f"THE GAME IS A TIE", True, sprites.BLACK)
-                textRect = text.get_rect()
-                textRect.center = (self.width//2, self.height//2)
-            self.display.blit(text, textRect)
-            pygame.display.update()
+            import pygame
+            import envs.sprites as sprites
+            sprites.draw_winner(self.display, self.winner)
+            if self.render_mode == 'human':
+                pygame.display.update()
 
             if self.fps <= 60:
-                pygame.time.wait(500) # Pause the last frame
                 if self.recording:
-                    for _ in range(15): # Pause the last frame of video for like a second
-                        self.video.update(cv2.cvtColor(pygame.surfarray.pixels3d(self.display).swapaxes(0, 1), cv2.COLOR_BGR2RGB))
+                    self.video.capture(self.display, repeat=15) # Hold the last frame of video for like a second, without waiting
+                elif self.render_mode == 'human':
+                    pygame.time.wait(500) # Pause the last frame
 
     def wins(self):
         """Gives a nice output of the wins for each team and the winrate of the red team
@@ -458,6 +517,7 @@ class parallel_env(ParallelEnv, EzPickle):
         """
         Closes the pygame display
         """
+        import pygame
         pygame.display.quit()
     
     def make_discrete(self, actions_dict):
@@ -475,7 +535,7 @@ class parallel_env(ParallelEnv, EzPickle):
         self.total_games += 1 
         self.ties += 1
         self.env_done = True
-        self.dones = {agent: True for agent in self.possible_agents}
+        self.done_buf.fill(True)
         if self.show:
             self.render()
 
@@ -491,7 +551,7 @@ class parallel_env(ParallelEnv, EzPickle):
         self.total_games += 1 
         self.team[winner]['wins'] += 1
         self.env_done = True
-        self.dones = {agent: True for agent in self.possible_agents}
+        self.done_buf.fill(True)
         if self.show:
             self.render()
 
@@ -505,76 +565,94 @@ class parallel_env(ParallelEnv, EzPickle):
             self.rendering = False
             return
 
+        import pygame
+        import envs.sprites as sprites
+
         # We need to initialize everything if not yet rendering
         if not self.rendering: 
             self.rendering = True
-            pygame.display.init()
             pygame.font.init()
-            self.display = pygame.display.set_mode((self.width, self.height))
-            pygame.display.set_caption("Battlespace Simulator")
-            self.clock = pygame.time.Clock()
-            if self.fps <= 60:
-                pygame.time.wait(500)
+            if self.render_mode == 'offscreen': # Plain surface, no window, display, or framerate
+                self.display = pygame.Surface((self.width, self.height), depth=32)
+            else:
+                pygame.display.init()
+                self.display = pygame.display.set_mode((self.width, self.height))
+                pygame.display.set_caption("Battlespace Simulator")
+                self.clock = pygame.time.Clock()
+                if self.fps <= 60:
+                    pygame.time.wait(500)
 
         # Check if we should quit
-        for event in pygame.event.get():
-            if event.type == KEYDOWN:
-                if event.key == K_ESCAPE: # If pressed escape
+        if self.render_mode == 'human':
+            for event in pygame.event.get():
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE: # If pressed escape
+                        self.close()
+                elif event.type == pygame.QUIT: # If trying to close the window
                     self.close()
-            elif event.type == QUIT: # If trying to close the window
-                self.close()
-
-        # Fill background
-        self.display.fill(sprites.WHITE)
-
-        # Draw bullets
-        for bullet in self.bullets:
-            bullet.draw(self.display)
-
-        # Draw explosions
-        for explosion in self.explosions:
-            explosion.draw(self.display)
-                
-        # Draw bases
-        self.team['red']['base'].draw(self.display)
-        self.team['blue']['base'].draw(self.display)
-
-        # Draw planes
-        for plane in self.team['red']['planes'].values():
-            if plane.alive:
-                plane.update()
-                plane.draw(self.display)
-        for plane in self.team['blue']['planes'].values():
-            if plane.alive:
-                plane.update()
-                plane.draw(self.display)
+
+        # Draw the bullets, explosions, bases, and planes
+        bases = [self.team['red']['base'], self.team['blue']['base']]
+        planes = [*self.team['red']['planes'].values(), *self.team['blue']['planes'].values()]
+        sprites.draw_scene(self.display, self.bullets, self.explosions, bases, planes)
 
         # Calls winner screen if done
         if self.winner != 'none':
             self.winner_screen()
 
-        # Update the display, update the video if recording, and tick the clock with the framerate
+        # Update the video if recording, then the display, and tick the clock with the framerate
         if self.recording:
-            self.video.update(cv2.cvtColor(pygame.surfarray.pixels3d(self.display).swapaxes(0, 1), cv2.COLOR_BGR2RGB))
-        pygame.display.update()
-        self.clock.tick(self.fps)
+            self.video.capture(self.display) # Copied here, encoded on the recorder's thread
+        if self.render_mode == 'human':
+            pygame.display.update()
+            self.clock.tick(self.fps)
 
     def start_recording(self, path):
         """
-        Starts recording a video of the rendering
+        Starts recording a video of the rendering, frames are streamed to the file as they are rendered
 
         Args:
             path (string): The path to save the video to
         """
+        from envs.recorder import VideoRecorder
         self.recording = True
-        self.video = vidmaker.Video(path, fps=self.fps, resolution=(self.width, self.height))
+        self.video = VideoRecorder(path, self.fps, (self.width, self.height))
     
     def export_video(self):
         """
-        Exports the video if recording
+        Finishes the video if recording
         """
         if self.recording:
             self.recording = False
-            self.video.export()
+            self.video.close()
+        else:
+            print('Not recording!')
+
+    def start_trajectory(self):
+        """
+        Starts recording the current game (call after reset) as a trajectory that replay.py can turn into a video
+        """
+        from envs.trajectory import TrajectoryRecorder
+        self.trajectory = TrajectoryRecorder(self)
+
+    def record_step(self, actions, rewards):
+        """Adds a step to the trajectory if one is being recorded
+
+        Args:
+            actions (np.array): Actions passed to step_arrays
+            rewards (np.array): Rewards of the step
+        """
+        if self.trajectory is not None:
+            self.trajectory.record(actions, rewards)
+
+    def save_trajectory(self, path):
+        """Writes the recorded trajectory and stops recording
+
+        Args:
+            path (string): Path of the .npz file
+        """
+        if self.trajectory is not None:
+            self.trajectory.save(path)
+            self.trajectory = None
         else:
-            print('Not recording!')
\ No newline at end of file
+            print('Not recording a trajectory!')
\ No newline at end of file
@@ -0,0 +1,453 @@
+import math
+import random
+import numpy as np
+
+# Plain-math simulation core
+# Nothing in here touches pygame, so headless training never needs a display or SDL
+# The sprites in envs/sprites.py only draw the states defined here
+
+DISP_WIDTH = 1200
+DISP_HEIGHT = 800
+
+# Sprite sizes (in pixels) from the images in assets/
+PLANE_W, PLANE_H = 50, 48
+BASE_W, BASE_H = 62, 62
+BULLET_W, BULLET_H = 6, 3
+
+TEAMS = ('red', 'blue') # Team codes used in the arrays
+
+# ---------- HELPER FUNCTIONS -----------
+def calc_new_xy(old_xy, speed, time, angle):
+    """
+    Takes a point, speed, timestep, and angle to calculate the new position
+    Returns the new point
+    """
+    new_x = old_xy[0] + (speed*time*math.cos(-math.radians(angle)))
+    new_y = old_xy[1] + (speed*time*math.sin(-math.radians(angle)))
+    return (new_x, new_y)
+
+def round_px(v):
+    """
+    Rounds a float coordinate to an integer pixel the same way a pygame Rect does (half away from zero)
+    Returns an int
+    """
+    return int(math.floor(v + 0.5)) if v >= 0 else int(math.ceil(v - 0.5))
+
+def to_px(v):
+    """
+    Vectorized round_px
+    Returns an int64 array
+    """
+    v = np.asarray(v, dtype=np.float64)
+    return np.where(v >= 0, np.floor(v + 0.5), np.ceil(v - 0.5)).astype(np.int64)
+
+def colliderect(ax, ay, aw, ah, bx, by, bw, bh):
+    """
+    pygame Rect.colliderect for rects given by their integer centers and sizes
+    Works on ints or (broadcast) arrays
+    """
+    al, at = ax - aw // 2, ay - ah // 2
+    bl, bt = bx - bw // 2, by - bh // 2
+    return (al < bl + bw) & (al + aw > bl) & (at < bt + bh) & (at + ah > bt)
+
+# ---------- BODY CLASS ----------
+class Body:
+    """
+    Box with an integer center and a size, stands in for a pygame Rect
+    """
+    def __init__(self, w, h):
+        """Initializes the box at (0, 0)
+
+        Args:
+            w (int): Width of the box
+            h (int): Height of the box
+        """
+        self.w, self.h = w, h
+        self.x, self.y = 0, 0
+
+    def set_pos(self, pos):
+        """Moves the center of the box, rounding to pixels like a pygame Rect
+
+        Args:
+            pos (tuple): (x, y) point to move the center to
+        """
+        self.x = round_px(pos[0])
+        self.y = round_px(pos[1])
+
+    def get_pos(self):
+        """Gives the current position as a point (x, y)
+
+        Returns:
+            tuple (x, y): current x-y position (center)
+        """
+        return (self.x, self.y)
+
+    def clamp(self):
+        """
+        Keeps the box on the screen
+        """
+        self.x = min(max(self.x, self.w // 2), DISP_WIDTH - self.w + self.w // 2)
+        self.y = min(max(self.y, self.h // 2), DISP_HEIGHT - self.h + self.h // 2)
+
+# ---------- PLANE CLASS ----------
+class PlaneState(Body):
+    """
+    Simulation state of a plane
+    """
+    def __init__(self, team, hp, id, rng=random):
+        """Initializes the values
+
+        Args:
+            team (string): Represents the color of the team that the plane is on; 'red' or 'blue'
+            hp (int): # of healthpoints for the plane (# of shots that can be taken)
+            id (string): The id used in env.agents and env.possible_agents
+            rng (random.Random, optional): Random number generator for the spawn. Defaults to the random module.
+        """
+        Body.__init__(self, PLANE_W, PLANE_H)
+        self.id = id
+        self.team = team
+        self.xmin = int(self.w)
+        self.xmax = int(DISP_WIDTH - self.w)
+        self.ymin = int(self.h)
+        self.ymax = int(DISP_HEIGHT - self.h)
+        self.direction = 0
+        self.max_hp = hp
+        self.hp = self.max_hp
+        self.alive = True
+        self.reset(rng)
+
+    def reset(self, rng=random):
+        """
+        Sets to a random position on the left or right side depending on team, drawn from rng
+        Resets all other values
+        """
+        self.hp = self.max_hp
+        self.alive = True
+        if self.team == 'red':
+            self.x = rng.randint(self.xmin, self.xmax // 3)
+            self.y = rng.randint(self.ymin, self.ymax)
+            self.direction = rng.randint(270, 450)
+            if self.direction >= 360: self.direction -= 360
+        else:
+            self.x = rng.randint(self.xmax // 3 * 2, self.xmax)
+            self.y = rng.randint(self.ymin, self.ymax)
+            self.direction = rng.randint(90, 270)
+
+    def rotate(self, angle):
+        """Rotates the plane by adding to self.direction
+
+        Args:
+            angle (float/int): # of degrees that the plane should turn
+        """
+        self.direction += angle
+        while self.direction > 360:
+            self.direction -= 360
+        while self.direction < 0:
+            self.direction += 360
+
+    def set_direction(self, direction):
+        """Sets self.direction
+
+        Args:
+            direction (float): # of degrees that represents the plane's direction
+        """
+        self.direction = direction
+
+    def forward(self, speed, time):
+        """Moves the plane forward based on the direction, speed, and timestep
+
+        Args:
+            speed (int): The speed that the plane moves at (in MPH)
+            time (float): Timestep for the plane (in hrs)
+        """
+        self.set_pos(calc_new_xy(self.get_pos(), speed, time, self.direction))
+        self.clamp() # Keep player on the screen
+
+    def hit(self):
+        """
+        Process a shot on the plane by decrementing hp
+
+        Returns:
+            hp (int): The HP after taking a hit
+        """
+        self.hp -= 1
+        if self.hp <= 0:
+            self.alive = False
+        return self.hp
+
+    def get_direction(self):
+        """Gives the current direction that the plane is facing
+
+        Returns:
+            float: Current direction in degrees
+        """
+        return self.direction
+
+# ---------- BASE CLASS ----------
+class BaseState(Body):
+    """
+    Simulation state of a base
+    """
+    def __init__(self, team, hp, rng=random):
+        """Initiates values for the base
+
+        Args:
+            team (string): Represents the team of the base, 'red' or 'blue'
+            hp (int): The # of hitpoints that the base should have
+            rng (random.Random, optional): Random number generator for the spawn. Defaults to the random module.
+        """
+        Body.__init__(self, BASE_W, BASE_H)
+        self.team = team
+        self.xmin = int(self.w)
+        self.xmax = int(DISP_WIDTH - self.w)
+        self.ymin = int(self.h)
+        self.ymax = int(DISP_HEIGHT - self.h)
+        self.max_hp = hp
+        self.hp = self.max_hp
+        self.alive = True
+        self.reset(rng)
+
+    def reset(self, rng=random):
+        """
+        Spawns base in random location on left or right of screen based on team, drawn from rng
+        Resets other values
+        """
+        self.alive = True
+        self.hp = self.max_hp
+        if self.team == 'red':
+            self.x = rng.randint(self.xmin, self.xmax // 3)
+            self.y = rng.randint(self.ymin, self.ymax)
+        else:
+            self.x = rng.randint(self.xmax // 3 * 2, self.xmax)
+            self.y = rng.randint(self.ymin, self.ymax)
+
+    def hit(self):
+        """Decrements the base's health
+
+        Returns:
+            int: HP after taking hit
+        """
+        self.hp -= 1
+        if self.hp <= 0:
+            self.alive = False
+        return self.hp
+
+# ---------- BULLETS ----------
+def move_bullets(xy, direction, dist, moving, travel):
+    """Moves bullets forward in place (vectorized calc_new_xy)
+
+    Args:
+        xy (np.array): [..., 2] integer bullet centers
+        direction (np.array): [...] bullet directions in degrees
+        dist (np.array): [...] distance each bullet has travelled
+        moving (np.array): [...] which bullets to move
+        travel (float): Distance a bullet moves in one time step
+    """
+    rads = -np.radians(direction)
+    x = to_px(xy[..., 0] + travel * np.cos(rads))
+    y = to_px(xy[..., 1] + travel * np.sin(rads))
+    xy[..., 0] = np.where(moving, x, xy[..., 0])
+    xy[..., 1] = np.where(moving, y, xy[..., 1])
+    dist[moving] += travel
+
+def bullet_hits(xy, team, live, base_xy, plane_xy, plane_alive, plane_team):
+    """Vectorized bullets-vs-targets test
+
+    A bullet hits the enemy base first, otherwise any enemy plane that is alive.
+    Any leading dimensions (e.g. a batch of games) are kept.
+
+    Args:
+        xy (np.array): [..., n_bullets, 2] integer bullet centers
+        team (np.array): [..., n_bullets] team of each bullet, 0 for red and 1 for blue
+        live (np.array): [..., n_bullets] which bullets can hit something
+        base_xy (np.array): [..., 2, 2] base centers, [red, blue]
+        plane_xy (np.array): [..., n_planes, 2] plane centers
+        plane_alive (np.array): [..., n_planes] which planes are alive
+        plane_team (np.array): [n_planes] team of each plane
+
+    Returns:
+        base_hit (np.array): [..., n_bullets] which bullets hit the enemy base
+        plane_hit (np.array): [..., n_bullets, n_planes] which enemy planes each bullet (that missed the base) collides with
+    """
+    x, y = xy[..., 0], xy[..., 1]
+    obase = np.take_along_axis(np.asarray(base_xy), (1 - team)[..., None], axis=-2) # [..., n_bullets, 2]
+    base_hit = live & colliderect(x, y, BULLET_W, BULLET_H, obase[..., 0], obase[..., 1], BASE_W, BASE_H)
+    plane_hit = colliderect(x[..., None], y[..., None], BULLET_W, BULLET_H, plane_xy[..., None, :, 0], plane_xy[..., None, :, 1], PLANE_W, PLANE_H)
+    plane_hit &= (live & ~base_hit)[..., None] & plane_alive[..., None, :] & (plane_team != team[..., None])
+    return base_hit, plane_hit
+
+class BulletPool:
+    """
+    Fixed capacity pool of bullets stored as arrays, free slots are reused through a free list
+    """
+    def __init__(self, capacity, speed, shot_dist):
+        """Allocates the arrays
+
+        Args:
+            capacity (int): Max # of bullets alive at once (the pool grows if it is ever exceeded)
+            speed (int): Speed that the bullets move at
+            shot_dist (int): Distance a bullet can travel before it disappears
+        """
+        self.speed = speed
+        self.shot_dist = shot_dist
+        self.capacity = 0
+        self.xy = np.zeros((0, 2), dtype=np.int64) # Centers
+        self.direction = np.zeros(0, dtype=np.float64) # Degrees
+        self.dist = np.zeros(0, dtype=np.float64) # Distance travelled
+        self.owner = np.zeros(0, dtype=np.int64) # Agent slot that fired the bullet
+        self.team = np.zeros(0, dtype=np.int64) # 0 for red, 1 for blue
+        self.seq = np.zeros(0, dtype=np.int64) # Firing order, bullets are resolved oldest first
+        self.active = np.zeros(0, dtype=bool)
+        self.free_slots = [] # Stack of unused slots
+        self.n_fired = 0
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        """Extends the arrays to a larger capacity
+
+        Args:
+            capacity (int): The new capacity
+        """
+        extra = capacity - self.capacity
+        self.xy = np.concatenate([self.xy, np.zeros((extra, 2), dtype=np.int64)])
+        for name in ('direction', 'dist', 'owner', 'team', 'seq', 'active'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros(extra, dtype=array.dtype)]))
+        self.free_slots = list(range(capacity - 1, self.capacity - 1, -1)) + self.free_slots
+        self.capacity = capacity
+
+    def clear(self):
+        """
+        Removes every bullet
+        """
+        self.active.fill(False)
+        self.free_slots = list(range(self.capacity - 1, -1, -1))
+
+    def spawn(self, x, y, angle, owner, team, rng=random):
+        """Fires a bullet with a small random spread
+
+        Args:
+            x (int): x coordinate to spawn bullet
+            y (int): y coordinate to spawn bullet
+            angle (float/int): Angle that the bullet is heading
+            owner (int): Agent slot of the plane that shot the bullet
+            team (int): Team that the bullet was shot from, 0 for red and 1 for blue
+            rng (random.Random, optional): Random number generator for the spread. Defaults to the random module.
+        """
+        if not self.free_slots:
+            self.grow(self.capacity * 2)
+        slot = self.free_slots.pop()
+        self.xy[slot] = (x, y)
+        self.direction[slot] = angle + (rng.random() * 8 - 4)
+        self.dist[slot] = 0
+        self.owner[slot] = owner
+        self.team[slot] = team
+        self.seq[slot] = self.n_fired
+        self.active[slot] = True
+        self.n_fired += 1
+
+    def kill(self, slots):
+        """Removes bullets and returns their slots to the free list
+
+        Args:
+            slots (np.array): Slots of the bullets to remove
+        """
+        self.active[slots] = False
+        self.free_slots.extend(slots.tolist())
+
+    def update(self, width, height, time, base_xy, plane_xy, plane_alive, plane_team):
+        """Moves every bullet and checks for collisions
+
+        Args:
+            width (int): Width of the display
+            height (int): Height of the display
+            time (float): Timestep to calculate the distance to move
+            base_xy (np.array): [2, 2] base centers, [red, blue]
+            plane_xy (np.array): [n_planes, 2] plane centers
+            plane_alive (np.array): [n_planes] which planes are alive
+            plane_team (np.array): [n_planes] team of each plane
+
+        Returns:
+            miss (np.array): Slots of the bullets that missed
+            base_hit (np.array): Slots of the bullets that hit the enemy base
+            plane_hit (np.array): Slots of the bullets that collide with an enemy plane, oldest first
+            candidates (np.array): [len(plane_hit), n_planes] enemy planes each of those bullets collides with
+        """
+        move_bullets(self.xy, self.direction, self.dist, self.active, self.speed * time)
+        x, y = self.xy[:, 0], self.xy[:, 1]
+
+        # Miss if travelled max dist or goes off screen
+        miss = self.active & ((self.dist >= self.shot_dist) | (x > width) | (x < 0) | (y > height) | (y < 0))
+        base_hit, plane_hit = bullet_hits(self.xy, self.team, self.active & ~miss, base_xy, plane_xy, plane_alive, plane_team)
+        hitting = np.flatnonzero(plane_hit.any(axis=1))
+        hitting = hitting[np.argsort(self.seq[hitting])]
+        return np.flatnonzero(miss), np.flatnonzero(base_hit), hitting, plane_hit[hitting]
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def __iter__(self):
+        """
+        Yields (x, y, direction, team) of every bullet, oldest first
+        """
+        slots = np.flatnonzero(self.active)
+        for slot in slots[np.argsort(self.seq[slots])]:
+            yield self.xy[slot, 0], self.xy[slot, 1], self.direction[slot], TEAMS[self.team[slot]]
+
+# ---------- OBSERVATIONS ----------
+def rel_angles(p0, a0, p1):
+    """
+    Relative angle of positions p1 seen from positions p0 facing angles a0, wrapped to [-180, 180]
+    Returns the angles in degrees
+    """
+    dx = p0[..., 0] - p1[..., 0]
+    dy = p0[..., 1] - p1[..., 1]
+    degs = np.degrees(np.arctan2(dy, dx) % (2 * np.pi))
+    rel = 180 + a0 - (360 - degs)
+    rel = np.where(rel < -180, rel + 360, rel)
+    rel = np.where(rel > 180, rel - 360, rel)
+    return rel
+
+def observe_all(plane_xy, plane_dir, plane_alive, base_xy, diagonal, out=None):
+    """Builds the observations of every agent at once (same layout as parallel_env.observe)
+
+    Distances and relative angles from every plane to every plane and base are computed as one
+    pairwise matrix, then each agent picks out the enemy base and enemy planes. Any leading
+    dimensions (e.g. a batch of games) are kept.
+
+    Args:
+        plane_xy (np.array): [..., n_planes, 2] plane centers, red planes first
+        plane_dir (np.array): [..., n_planes] plane directions in degrees
+        plane_alive (np.array): [..., n_planes] which planes are alive
+        base_xy (np.array): [..., 2, 2] base centers, [red, blue]
+        diagonal (float): Length of the diagonal of the game field, used to normalize distances
+        out (np.array, optional): Preallocated float32 array to write the observations into. Defaults to None.
+
+    Returns:
+        observations (np.array): [..., n_planes, 3 * n_agents + 2] observations, -1 for dead agents
+    """
+    plane_xy = np.asarray(plane_xy, dtype=np.float64)
+    plane_alive = np.asarray(plane_alive, dtype=bool)
+    n_planes = plane_xy.shape[-2]
+    n_agents = n_planes // 2
+    lead = plane_xy.shape[:-2]
+
+    # Pairwise matrices from every plane to every plane and base
+    points = np.concatenate([plane_xy, np.broadcast_to(base_xy, lead + (2, 2))], axis=-2) # [..., n_planes + 2, 2]
+    dists = np.sqrt(np.sum((plane_xy[..., :, None, :] - points[..., None, :, :]) ** 2, axis=-1)) / diagonal * 2 - 1
+    angles = rel_angles(plane_xy[..., :, None, :], np.asarray(plane_dir)[..., :, None], points[..., None, :, :]) / 360
+
+    # Columns of the enemy base and enemy planes for every agent
+    team = np.arange(n_planes) // n_agents # 0 for red, 1 for blue
+    rows = np.arange(n_planes)
+    enemy_base = n_planes + 1 - team
+    enemy_planes = (1 - team)[:, None] * n_agents + np.arange(n_agents)[None, :] # [n_planes, n_agents]
+
+    obs = np.empty(lead + (n_planes, 3 * n_agents + 2), dtype=np.float32) if out is None else out
+    obs[..., 0] = dists[..., rows, enemy_base]
+    obs[..., 1] = angles[..., rows, enemy_base]
+    enemy_obs = np.stack([np.ones(lead + enemy_planes.shape), dists[..., rows[:, None], enemy_planes], angles[..., rows[:, None], enemy_planes]], axis=-1)
+    enemy_obs[~plane_alive[..., enemy_planes]] = -1 # Dead enemies are observed as -1
+    obs[..., 2:] = enemy_obs.reshape(lead + (n_planes, 3 * n_agents))
+    obs[~plane_alive] = -1 # Dead agents only observe -1
+    return obs
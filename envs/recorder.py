@@ -0,0 +1,99 @@
+import queue
+import sys
+import threading
+import numpy as np
+
+# Video recording off the simulation thread
+# Frames are copied into a fixed ring of reusable buffers and a background thread converts and encodes them
+# straight into the .mp4, so recording costs one copy per frame and never holds a whole game in memory
+
+class VideoRecorder:
+    """
+    Streams frames of a pygame surface to an .mp4 file from a background thread
+    """
+    def __init__(self, path, fps, resolution, n_buffers=32):
+        """Opens the video file and starts the encoder thread
+
+        Args:
+            path (string): Path of the .mp4 file
+            fps (int): Framerate of the video
+            resolution (tuple): (width, height) of the frames
+            n_buffers (int, optional): Frames that can wait for the encoder before capture() blocks. Defaults to 32.
+        """
+        import cv2
+        self.path = path
+        width, height = resolution
+        self.width = width
+        self.height = height
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+        if not self.writer.isOpened():
+            raise IOError(f'Could not open {path} for writing')
+        self.error = None # Exception from the encoder thread, raised on the next capture
+
+        # Ring of raw 4 byte per pixel frame buffers, an index is either free or waiting to be encoded
+        self.buffers = np.zeros((n_buffers, height, width, 4), dtype=np.uint8)
+        self.free = queue.Queue()
+        for idx in range(n_buffers):
+            self.free.put(idx)
+        self.ready = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def capture(self, surface, repeat=1):
+        """Copies a frame into the ring, the encoding happens on the encoder thread
+
+        Args:
+            surface (pygame.Surface): The surface to record, the same size as the video
+            repeat (int, optional): Number of frames the image is held for. Defaults to 1.
+        """
+        import pygame
+        if self.error is not None:
+            raise self.error
+        idx = self.free.get() # Waits only if the encoder is n_buffers frames behind
+        if surface.get_bytesize() == 4:
+            # Copy the pixel rows as they are, much faster than pixels3d, the encoder sorts out the channels
+            raw = surface.get_buffer() # Locks the surface
+            rows = np.frombuffer(raw, dtype=np.uint8).reshape(self.height, surface.get_pitch())
+            np.copyto(self.buffers[idx], rows[:, :self.width * 4].reshape(self.height, self.width, 4))
+            del rows, raw # Unlocks the surface
+            shifts = [shift // 8 for shift in surface.get_shifts()[:3]] # Byte of red, green and blue in a pixel
+            if sys.byteorder == 'big':
+                shifts = [3 - shift for shift in shifts]
+            order = (shifts[2], shifts[1], shifts[0])
+        else:
+            pixels = pygame.surfarray.pixels3d(surface) # [width, height, 3] view that locks the surface
+            np.copyto(self.buffers[idx, :, :, :3], pixels.swapaxes(0, 1))
+            del pixels # Unlocks the surface
+            order = (2, 1, 0)
+        self.ready.put((idx, repeat, order))
+
+    def run(self):
+        import cv2
+        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8) # BGR frame for the writer
+        while True:
+            item = self.ready.get()
+            if item is None:
+                break
+            idx, repeat, order = item # order is the byte of blue, green and red in the buffer
+            try:
+                if order == (0, 1, 2):
+                    cv2.cvtColor(self.buffers[idx], cv2.COLOR_BGRA2BGR, dst=frame)
+                elif order == (2, 1, 0):
+                    cv2.cvtColor(self.buffers[idx], cv2.COLOR_RGBA2BGR, dst=frame)
+                else:
+                    frame[:] = self.buffers[idx][:, :, list(order)]
+                for _ in range(repeat):
+                    self.writer.write(frame)
+            except Exception as e:
+                self.error = e
+            self.free.put(idx)
+
+    def close(self):
+        """
+        Encodes the frames that are still waiting and finishes the file
+        """
+        self.ready.put(None)
+        self.thread.join()
+        self.writer.release()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,40 @@
+import hashlib
+import numpy as np
+
+# Fixed, versioned suites of game seeds so models can be evaluated on identical games
+# A seed passed to parallel_env.reset_arrays(seed) fixes the spawns of the bases and planes and the bullet spread,
+# so when two models play the same seeds the difference in their results comes from the models, not from the starts.
+# Never change the entropy of a released version, add a new version instead so old results stay comparable.
+
+SUITES = {
+    1: 0x5CE7A210 # Entropy of each suite version
+}
+SUITE_VERSION = 1 # Version used by default
+
+def scenario_seeds(n_games, version=SUITE_VERSION):
+    """Gets the seeds of a scenario suite
+
+    Args:
+        n_games (int): Number of scenarios
+        version (int, optional): Suite version. Defaults to SUITE_VERSION.
+
+    Returns:
+        list: The first n_games seeds, the same prefix for any n_games
+    """
+    return [int(seed) for seed in np.random.SeedSequence(SUITES[version]).generate_state(n_games)]
+
+def fingerprint(env, seeds):
+    """Hashes the starting states of scenarios, equal fingerprints mean identical starts
+    The env is left reset to the last scenario
+
+    Args:
+        env (parallel_env): The environment
+        seeds (list): Scenario seeds
+
+    Returns:
+        string: Short hex digest
+    """
+    digest = hashlib.sha1()
+    for seed in seeds:
+        digest.update(env.reset_arrays(seed).tobytes())
+    return digest.hexdigest()[:12]
@@ -0,0 +1,187 @@
+import multiprocessing as mp
+import os
+import traceback
+import numpy as np
+import envs.battle_env as battle_env
+
+# Winner codes used by SubprocBattleEnv.winner
+NONE, RED, BLUE, TIE = -1, 0, 1, 2
+WINNER_NAMES = {NONE: 'none', RED: 'red', BLUE: 'blue', TIE: 'tie'}
+WINNER_CODES = {name: code for code, name in WINNER_NAMES.items()}
+
+def shared_array(shape, dtype):
+    """
+    Allocates a numpy array backed by shared memory so it can be handed to worker processes
+    Returns the raw shared buffer and the array viewing it
+    """
+    dtype = np.dtype(dtype)
+    raw = mp.RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    return raw, np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+def worker(conn, idx, env_config, seed, buffers, shapes):
+    """Runs one parallel_env in a worker process
+
+    Commands are single bytes from the pipe: b's' steps, b'r' resets, b'c' closes.
+    The second byte of a step/reset picks which observation buffer to write to.
+    All actions and results go through the shared memory buffers.
+
+    Args:
+        conn (Connection): Pipe to the main process
+        idx (int): Index of this env in the shared buffers
+        env_config (dict): Keyword arguments for battle_env.parallel_env
+        seed (int): Seed of this env's random number generator
+        buffers (dict): Raw shared buffers
+        shapes (dict): (shape, dtype) of each buffer
+    """
+    arrays = {name: np.frombuffer(buffers[name], dtype=dtype).reshape(shape) for name, (shape, dtype) in shapes.items()}
+    env = battle_env.parallel_env(**env_config, seed=seed) # Its own stream, forked workers would otherwise share one
+    while True:
+        cmd = conn.recv_bytes()
+        try:
+            if cmd[:1] == b'c':
+                env.close()
+                conn.send_bytes(b'ok')
+                break
+            obs_buf = arrays['obs'][cmd[1] - ord('0'), idx]
+            if cmd[:1] == b'r':
+                obs_buf[:] = env.reset_arrays()
+                arrays['env_done'][idx] = False
+                arrays['winner'][idx] = NONE
+            elif cmd[:1] == b's':
+                obs, rewards, dones = env.step_arrays(arrays['actions'][idx])
+                obs_buf[:] = obs
+                arrays['rewards'][idx] = rewards
+                arrays['dones'][idx] = dones
+                arrays['env_done'][idx] = env.env_done
+                arrays['winner'][idx] = WINNER_CODES[env.winner]
+                if env.env_done: # Auto reset so the caller always gets a full batch
+                    arrays['final_obs'][idx] = obs
+                    obs_buf[:] = env.reset_arrays()
+            conn.send_bytes(b'ok')
+        except Exception:
+            conn.send_bytes(traceback.format_exc().encode())
+
+class SubprocBattleEnv:
+    """K parallel_env games stepped in worker processes
+
+    Actions, observations, rewards and dones are exchanged through shared memory NumPy
+    buffers, so nothing is pickled per step. Finished games are reset automatically: the
+    returned observations are then the first observations of the new game, and the last
+    observations of the finished game are kept in self.final_obs.
+    """
+
+    def __init__(self, n_envs, env_config, start_method=None, seed=None):
+        """Starts the worker processes
+
+        Args:
+            n_envs (int): The number of games (and worker processes)
+            env_config (dict): Keyword arguments for battle_env.parallel_env
+            start_method (string, optional): multiprocessing start method ('fork', 'spawn', ...). Defaults to the platform default.
+            seed (int, optional): Env idx is seeded with seed + idx. Defaults to a seed from the OS.
+        """
+        self.n_envs = n_envs
+        env_config = dict(env_config, show=False) # Workers never render
+
+        # Local env used for the spaces and values that the teams read (width, shot_dist, ...)
+        self.template = battle_env.parallel_env(**env_config)
+        for name in ('n_agents', 'n_actions', 'obs_size', 'possible_agents', 'possible_red', 'possible_blue', 'continuous_actions', 'width', 'height', 'shot_dist'):
+            setattr(self, name, getattr(self.template, name))
+        if self.continuous_actions:
+            self.max_turn = self.template.max_turn
+        n_planes = len(self.possible_agents)
+
+        # Shared buffers
+        shapes = {
+            'actions': ((n_envs, n_planes, self.n_actions), np.float64),
+            'obs': ((2, n_envs, n_planes, self.obs_size), np.float32), # Two buffers, the previous observations stay valid for one step
+            'final_obs': ((n_envs, n_planes, self.obs_size), np.float32),
+            'rewards': ((n_envs, n_planes), np.float64),
+            'dones': ((n_envs, n_planes), bool),
+            'env_done': ((n_envs,), bool),
+            'winner': ((n_envs,), np.int8),
+        }
+        buffers = {}
+        for name, (shape, dtype) in shapes.items():
+            buffers[name], array = shared_array(shape, dtype)
+            setattr(self, name, array)
+        self.obs_flip = 0
+
+        # Start the workers, each game with its own seed
+        if seed is None:
+            seed = int.from_bytes(os.urandom(4), 'little')
+        self.seed = seed
+        ctx = mp.get_context(start_method)
+        self.conns = []
+        self.processes = []
+        for idx in range(n_envs):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=worker, args=(child_conn, idx, env_config, seed + idx, buffers, shapes), daemon=True)
+            process.start()
+            child_conn.close()
+            self.conns.append(parent_conn)
+            self.processes.append(process)
+        self.closed = False
+
+    def send(self, cmd):
+        """Sends a command to every worker and waits for all of them to finish
+
+        Args:
+            cmd (bytes): The command
+        """
+        for conn in self.conns:
+            conn.send_bytes(cmd)
+        for conn in self.conns:
+            reply = conn.recv_bytes()
+            if reply != b'ok':
+                raise RuntimeError(f"Worker failed:\n{reply.decode()}")
+
+    def reset(self):
+        """Resets every game
+
+        Returns:
+            observations (np.array): [n_envs, n_planes, obs_size] initial observations
+        """
+        self.obs_flip ^= 1
+        self.send(b'r' + str(self.obs_flip).encode())
+        return self.obs[self.obs_flip]
+
+    def step(self, actions):
+        """Takes a step in every game
+
+        The returned arrays live in shared memory and are overwritten by later steps
+
+        Args:
+            actions (np.array): [n_envs, n_planes] discrete actions or [n_envs, n_planes, n_actions] action vectors
+
+        Returns:
+            observations (np.array): [n_envs, n_planes, obs_size] observations (of the new game if it was reset)
+            rewards (np.array): [n_envs, n_planes] rewards
+            dones (np.array): [n_envs, n_planes] which agents are done
+            env_done (np.array): [n_envs] which games finished this step (their winners are in self.winner)
+        """
+        actions = np.asarray(actions)
+        if not self.continuous_actions and actions.ndim == 2: # Discrete actions are sent as one-hot vectors
+            actions = np.eye(self.n_actions)[actions]
+        self.actions[:] = actions
+        self.obs_flip ^= 1
+        self.send(b's' + str(self.obs_flip).encode())
+        return self.obs[self.obs_flip], self.rewards, self.dones, self.env_done
+
+    def winners(self):
+        """Gives the name of the winner of each game that finished on the last step
+
+        Returns:
+            list: 'none', 'red', 'blue', or 'tie' for each game
+        """
+        return [WINNER_NAMES[int(w)] for w in self.winner]
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        if self.closed:
+            return
+        self.send(b'c')
+        for process in self.processes:
+            process.join()
+        self.closed = True
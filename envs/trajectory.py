@@ -0,0 +1,123 @@
+import os
+import numpy as np
+import envs.core as core
+
+# Compact per-step record of a game, enough to draw every frame again later (see replay.py)
+# Planes, bases, bullets, actions, and rewards are kept as small integer/float32 arrays and written as one
+# compressed .npz per game. Bullets vary in number, so they are stored flat with the offset of each step.
+
+VERSION = 1
+
+class TrajectoryRecorder:
+    """
+    Records the state of a parallel_env after every step of one game
+    """
+    def __init__(self, env):
+        """Starts the trajectory from the env's current state
+
+        Args:
+            env (parallel_env): The environment, already reset
+        """
+        self.env = env
+        self.planes = [env.team[env.team_map[agent]]['planes'][agent] for agent in env.possible_agents] # Dead planes keep their last state
+        self.plane_xy = []
+        self.plane_dir = []
+        self.plane_hp = []
+        self.plane_alive = []
+        self.base_hp = []
+        self.bullets = []
+        self.actions = []
+        self.rewards = []
+        self.death_order = [] # Planes in the order they died, which sets the order of explosions in the same step
+        self.base_xy = np.array([env.team[team]['base'].get_pos() for team in core.TEAMS], dtype=np.int16) # Bases never move
+        self.record_state()
+
+    def record_state(self):
+        env = self.env
+        self.plane_xy.append(np.array([plane.get_pos() for plane in self.planes], dtype=np.int16))
+        self.plane_dir.append(np.array([plane.get_direction() for plane in self.planes], dtype=np.float32))
+        self.plane_hp.append(np.array([plane.hp for plane in self.planes], dtype=np.int8))
+        self.plane_alive.append(np.array([plane.alive for plane in self.planes], dtype=bool))
+        self.base_hp.append(np.array([env.team[team]['base'].hp for team in core.TEAMS], dtype=np.int8))
+
+        # Bullets oldest first, the order they are drawn in
+        pool = env.bullets
+        slots = np.flatnonzero(pool.active)
+        slots = slots[np.argsort(pool.seq[slots])]
+        self.bullets.append((pool.xy[slots].astype(np.int16), pool.direction[slots].astype(np.float32), pool.team[slots].astype(np.int8)))
+
+    def died(self, idx):
+        """Notes that a plane died
+
+        Args:
+            idx (int): Index of the plane in env.possible_agents
+        """
+        self.death_order.append(idx)
+
+    def record(self, actions, rewards):
+        """Records a step
+
+        Args:
+            actions (np.array): Actions passed to step_arrays, None if there were none
+            rewards (np.array): Rewards of the step
+        """
+        env = self.env
+        if actions is None:
+            actions = np.zeros((len(env.possible_agents), env.n_actions) if env.continuous_actions else len(env.possible_agents))
+        elif not env.continuous_actions and np.ndim(actions) > 1: # Action vectors in the discrete action space
+            actions = np.argmax(actions, axis=-1)
+        self.actions.append(np.asarray(actions, dtype=np.float32 if env.continuous_actions else np.int8))
+        self.rewards.append(np.asarray(rewards, dtype=np.float32))
+        self.record_state()
+
+    def save(self, path):
+        """Writes the trajectory
+
+        Args:
+            path (string): Path of the .npz file
+        """
+        env = self.env
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        counts = [len(xy) for xy, _, _ in self.bullets]
+        n_planes = len(env.possible_agents)
+        action_shape = (0, n_planes, env.n_actions) if env.continuous_actions else (0, n_planes)
+        np.savez_compressed(
+            path,
+            version=VERSION,
+            agents=np.array(env.possible_agents),
+            n_agents=env.n_agents,
+            fps=env.fps,
+            continuous_actions=env.continuous_actions,
+            winner=env.winner,
+            plane_xy=np.stack(self.plane_xy),
+            plane_dir=np.stack(self.plane_dir),
+            plane_hp=np.stack(self.plane_hp),
+            plane_alive=np.stack(self.plane_alive),
+            death_order=np.array(self.death_order, dtype=np.int8),
+            base_xy=self.base_xy,
+            base_hp=np.stack(self.base_hp),
+            bullet_offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            bullet_xy=np.concatenate([xy for xy, _, _ in self.bullets]).reshape(-1, 2),
+            bullet_dir=np.concatenate([direction for _, direction, _ in self.bullets]),
+            bullet_team=np.concatenate([team for _, _, team in self.bullets]),
+            actions=np.stack(self.actions) if self.actions else np.zeros(action_shape),
+            rewards=np.stack(self.rewards) if self.rewards else np.zeros((0, n_planes), dtype=np.float32)
+        )
+
+def load_trajectory(path):
+    """Reads a trajectory
+
+    Args:
+        path (string): Path of the .npz file
+
+    Returns:
+        dict: The arrays, step t of the game is index t of the per-step arrays (0 is the start)
+    """
+    with np.load(path) as data:
+        trajectory = {key: data[key] for key in data.files}
+    if int(trajectory['version']) != VERSION:
+        raise ValueError(f'{path} is a version {int(trajectory["version"])} trajectory, expected {VERSION}')
+    trajectory['winner'] = str(trajectory['winner'])
+    trajectory['agents'] = [str(agent) for agent in trajectory['agents']]
+    return trajectory
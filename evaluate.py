@@ -1,112 +1,243 @@
 import envs.battle_env as battle_env
 import instinct.team as instinct
-import maddpg.team as maddpg
-import matplotlib.pyplot as plt
+from maddpg.numpy_actor import NumpyPolicy
+from utils.noise import OUNoise
+import multiprocessing as mp
+import numpy as np
+import io
 import json
+import math
 import os
-import shutil
+import random
 import sys
-
-def merge_dicts(dict1, dict2):
-    dict2.update(dict1)
-    return dict2
-
-def main():
-    model_name = input('Enter model name: ')
-    FOLDER = f'models/{model_name}'
-    if not os.path.exists(FOLDER):
-        print('Model does not exist')
-        sys.exit()
-
-    params = {}
-    env_config = {}
-        
-    # Load params and env_config and scores
+import time
+
+eval_config = {
+    'max_games': 10_000, # Most games to play
+    'min_games': 500, # Games before stopping early is allowed
+    'target_width': 0.02, # Stop once every confidence interval is narrower than this
+    'z': 1.96, # z-score of the confidence intervals (1.96 is 95%)
+    'games_per_task': 50, # Games a worker plays before reporting back
+    'n_workers': os.cpu_count(), # Worker processes
+    'seed': 0, # Task i seeds its games with seed + i
+    'n_videos': 10 # Games recorded to eval_videos after evaluating
+}
+
+OUTCOMES = ['red', 'blue', 'tie']
+
+worker = {} # Env and teams of a worker process, set by init_worker
+
+def wilson_interval(successes, n, z=1.96):
+    """Wilson score interval of a rate, which stays sensible near 0 and 1 unlike the normal approximation
+
+    Args:
+        successes (int): Number of successes
+        n (int): Number of trials
+        z (float, optional): z-score of the interval. Defaults to 1.96.
+
+    Returns:
+        float: Lower bound
+        float: Upper bound
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    denominator = 1 + z**2 / n
+    center = (p + z**2 / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+def play_game(env, policy, blue_team, noise, seed=None):
+    """Plays one game of the exported red actors against the instinct team
+
+    Args:
+        env (parallel_env): The environment
+        policy (NumpyPolicy): Red team actors
+        blue_team (instinct.Team): Blue team
+        noise (OUNoise): Noise added to the red actions, shaped (n_red, n_actions)
+        seed (int, optional): Scenario seed for the env. Defaults to None.
+
+    Returns:
+        string: Winner, 'red', 'blue', or 'tie'
+        int: Number of steps
+    """
+    n_red = len(env.possible_red)
+    observations = env.reset_arrays(seed)
+    noise.reset()
+    n_steps = 0
+    while not env.env_done:
+        red_actions = np.clip(policy.choose_actions_batch(observations[None, :n_red])[0] + noise.noise(), -1, 1)
+        blue_actions = blue_team.choose_actions_batch(observations[None, n_red:])[0]
+        if env.continuous_actions:
+            actions = np.concatenate([red_actions, blue_actions])
+        else:
+            actions = np.concatenate([np.argmax(red_actions, axis=1), blue_actions])
+        observations, _, _ = env.step_arrays(actions)
+        n_steps += 1
+    return env.winner, n_steps
+
+def init_worker(env_config, models):
+    """Builds the env and teams of a worker process
+
+    Args:
+        env_config (dict): Keyword arguments for battle_env.parallel_env
+        models (list): (actors, noise_scale) of each red model, actors as written by maddpg.export.export_actors
+    """
+    env = battle_env.parallel_env(**dict(env_config, show=False))
+    worker['env'] = env
+    worker['policies'] = [NumpyPolicy(io.BytesIO(actors)) for actors, _ in models]
+    worker['noises'] = [OUNoise((len(env.possible_red), env.n_actions), scale=noise_scale) for _, noise_scale in models]
+    worker['blue_team'] = instinct.Team(env.possible_blue, env.possible_red, env)
+
+def play_games(args):
+    """Plays a block of games in a worker process
+
+    Args:
+        args (tuple): Index of the block, games in the block, and the base seed.
+                      The block is seeded with seed + index so results don't depend on scheduling
+
+    Returns:
+        np.array: Red wins, blue wins, and ties
+        int: Total steps
+    """
+    task, n_games, seed = args
+    random.seed(seed + task)
+    np.random.seed(seed + task)
+    counts = np.zeros(len(OUTCOMES), dtype=np.int64)
+    steps = 0
+    for _ in range(n_games):
+        winner, n_steps = play_game(worker['env'], worker['policies'][0], worker['blue_team'], worker['noises'][0])
+        counts[OUTCOMES.index(winner)] += 1
+        steps += n_steps
+    return counts, steps
+
+def play_scenarios(seeds):
+    """Plays every model of a worker process on the same scenarios
+
+    Args:
+        seeds (list): Scenario seeds from envs.scenarios
+
+    Returns:
+        np.array: [n_models, n_seeds] index in OUTCOMES of each game's winner
+    """
+    outcomes = np.zeros((len(worker['policies']), len(seeds)), dtype=np.int64)
+    for idx, seed in enumerate(seeds):
+        for model, (policy, noise) in enumerate(zip(worker['policies'], worker['noises'])):
+            np.random.seed(seed) # The red noise and instinct draws are shared too
+            winner, _ = play_game(worker['env'], policy, worker['blue_team'], noise, seed)
+            outcomes[model, idx] = OUTCOMES.index(winner)
+    return outcomes
+
+def evaluate(env_config, actors, noise_scale, config):
+    """Plays games in a process pool until max_games, or until every interval is narrower than target_width
+
+    Args:
+        env_config (dict): Keyword arguments for battle_env.parallel_env
+        actors (bytes): The red actors as written by maddpg.export.export_actors
+        noise_scale (float): Scale of the noise added to the red actions
+        config (dict): Settings like eval_config
+
+    Returns:
+        np.array: Red wins, blue wins, and ties
+        int: Total steps
+    """
+    n_tasks = math.ceil(config['max_games'] / config['games_per_task'])
+    sizes = [min(config['games_per_task'], config['max_games'] - task * config['games_per_task']) for task in range(n_tasks)]
+    counts = np.zeros(len(OUTCOMES), dtype=np.int64)
+    steps = 0
+    start = time.perf_counter()
+
+    ctx = mp.get_context('spawn') # The parent has torch loaded, which isn't safe to fork
+    with ctx.Pool(config['n_workers'], initializer=init_worker, initargs=(env_config, [(actors, noise_scale)])) as pool:
+        tasks = [(task, size, config['seed']) for task, size in enumerate(sizes)]
+        for task_counts, task_steps in pool.imap_unordered(play_games, tasks):
+            counts += task_counts
+            steps += task_steps
+            n = counts.sum()
+
+            intervals = [wilson_interval(count, n, config['z']) for count in counts]
+            elapsed = time.perf_counter() - start
+            rates = ' | '.join(f'{outcome} {count / n:.3f} [{low:.3f}, {high:.3f}]' for outcome, count, (low, high) in zip(OUTCOMES, counts, intervals))
+            sys.stdout.write(f'\r{n} games | {rates} | {n / elapsed:.1f} games/s ') # Will overwrite the previous line
+            sys.stdout.flush()
+
+            if n >= config['min_games'] and all(high - low <= config['target_width'] for low, high in intervals):
+                print(f'\nEvery interval is narrower than {config["target_width"]}, stopping early')
+                break
+        else:
+            print()
+        # Leaving the with block terminates the workers that are still playing
+    return counts, steps
+
+def load_model(FOLDER):
+    """Loads a model's config and exports its red actors
+
+    Args:
+        FOLDER (string): The model folder
+
+    Returns:
+        dict: The env config from cf.json
+        bytes: The red actors as written by maddpg.export.export_actors
+        float: Scale of the exploration noise the team plays with
+    """
+    # torch is only needed here to load the model, the workers run the exported actors with NumPy
+    import maddpg.team as maddpg
+    import maddpg.shared_team as shared_team
+    from maddpg.export import export_actors
+
+    # Load params and env_config
     with open(f'{FOLDER}/params.json', 'r') as f:
         params = json.load(f)
     with open(f'{FOLDER}/cf.json', 'r') as f:
         env_config = json.load(f)
-
     env_config['show'] = False
 
     env = battle_env.parallel_env(**env_config)
     red_agent_list = env.possible_red
-    blue_agent_list = env.possible_blue
-
     obs_len = env.observation_space(red_agent_list[0]).shape[0]
     critic_dims = obs_len * env.n_agents
 
-    # Red team is the maddpg team
-    red_team = maddpg.Team(red_agent_list, obs_len, env.n_actions, critic_dims, params['fc1_dims'], params['fc2_dims'], params['buffer_size'], params['batch_size'], params['gamma'], params['lr'], FOLDER)
+    # Red team is the maddpg team, only its actors are used so a small buffer is enough
+    team_class = shared_team.SharedTeam if params.get('shared_networks', False) else maddpg.Team
+    red_team = team_class(red_agent_list, obs_len, env.n_actions, critic_dims, params['fc1_dims'], params['fc2_dims'], params['batch_size'], params['batch_size'], params['gamma'], params['lr'], FOLDER)
     red_team.load_models()
+    noise_scale = next(iter(red_team.noises().values())).scale
+    buffer = io.BytesIO()
+    export_actors(red_team, buffer)
+    red_team.close()
+    return env_config, buffer.getvalue(), noise_scale
+
+def main():
+    model_name = input('Enter model name: ')
+    FOLDER = f'models/{model_name}'
+    if not os.path.exists(FOLDER):
+        print('Model does not exist')
+        sys.exit()
 
-    # Blue team is the instinct team
-    blue_team = instinct.Team(blue_agent_list, red_agent_list, env)
-
-    wins = {
-        "red": 0,
-        "blue": 0,
-        "tie": 0
-    }
-
-    for _ in range(10000):
-        observations = env.reset()
-
-        red_obs = {}
-        blue_obs = {}
-        red_obs_ = {}
-        blue_obs_ = {}
-
-        for agent in red_agent_list:
-            red_obs[agent] = observations[agent]
-        for agent in blue_agent_list:
-            blue_obs[agent] = observations[agent]
-
-        observations = env.reset()
-        actions = {}
-
-        while not env.env_done:
-            actions = merge_dicts(red_team.choose_actions(red_obs), blue_team.choose_actions(blue_obs))
-            observations_, rewards, dones, _ = env.step(actions)
-            for agent in red_agent_list:
-                red_obs_[agent] = observations_[agent]
-            for agent in blue_agent_list:
-                blue_obs_[agent] = observations_[agent]
-            red_obs = red_obs_
-            blue_obs = blue_obs_
-        
-        wins[env.winner] += 1
-
-    env.show = True
-    env.start_recording(path=f'{FOLDER}/eval_videos/')
-
-    for _ in range(10):
-        observations = env.reset()
-
-        red_obs = {}
-        blue_obs = {}
-        red_obs_ = {}
-        blue_obs_ = {}
-
-        for agent in red_agent_list:
-            red_obs[agent] = observations[agent]
-        for agent in blue_agent_list:
-            blue_obs[agent] = observations[agent]
-
-        observations = env.reset()
-        actions = {}
-
-        while not env.env_done:
-            actions = merge_dicts(red_team.choose_actions(red_obs), blue_team.choose_actions(blue_obs))
-            observations_, rewards, dones, _ = env.step(actions)
-            for agent in red_agent_list:
-                red_obs_[agent] = observations_[agent]
-            for agent in blue_agent_list:
-                blue_obs_[agent] = observations_[agent]
-            red_obs = red_obs_
-            blue_obs = blue_obs_
-
-    env.stop_recording()
+    env_config, actors, noise_scale = load_model(FOLDER)
+
+    start = time.perf_counter()
+    counts, steps = evaluate(env_config, actors, noise_scale, eval_config)
+    elapsed = time.perf_counter() - start
+    n = counts.sum()
+
+    print(f'{n} games, {steps} steps in {elapsed:.1f} s ({n / elapsed:.1f} games/s)')
+    for outcome, count in zip(OUTCOMES, counts):
+        low, high = wilson_interval(count, n, eval_config['z'])
+        print(f'{outcome.capitalize():<5} {count / n:.2%} ({low:.2%} - {high:.2%})')
+
+    # Record a few games
+    if eval_config['n_videos'] > 0:
+        os.makedirs(f'{FOLDER}/eval_videos', exist_ok=True)
+        init_worker(env_config, [(actors, noise_scale)])
+        env = worker['env']
+        env.show = True
+        env.render_mode = 'offscreen' # No window, and not held to the framerate
+        for i in range(eval_config['n_videos']):
+            env.start_recording(f'{FOLDER}/eval_videos/{i}.mp4')
+            play_game(env, worker['policies'][0], worker['blue_team'], worker['noises'][0])
+            env.export_video()
+        env.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
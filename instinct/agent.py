@@ -60,3 +60,57 @@ class InstinctAgent:
                 return 3
             else:
                 return 2
+
+
+def instinct_actions(observations, n_enemies, env):
+    """Chooses the instinct actions for many agents at once, the same decisions as InstinctAgent.choose_action
+
+    Args:
+        observations (np.array): [..., obs_len] observations, e.g. [n_envs, n_agents, obs_len]
+        n_enemies (int): Number of enemy planes
+        env (parallel_env): Environment the observations are from (for its size, shot distance and action type)
+
+    Returns:
+        np.array: [...] targets, 0 for the base or 1 + the index of the enemy plane
+        np.array: [...] discrete actions or [..., 3] continuous actions
+    """
+    obs = np.asarray(observations, dtype=np.float64)
+    diagonal = math.sqrt(math.pow(env.width, 2) + math.pow(env.height, 2))
+
+    # Distance and angle to the base, then to each enemy
+    dist = np.empty(obs.shape[:-1] + (n_enemies + 1,))
+    angle = np.empty(obs.shape[:-1] + (n_enemies + 1,))
+    dist[..., 0] = (obs[..., 0] + 1) / 2 * diagonal
+    angle[..., 0] = obs[..., 1] * 360
+    dist[..., 1:] = (obs[..., 3::3][..., :n_enemies] + 1) / 2 * diagonal
+    angle[..., 1:] = obs[..., 4::3][..., :n_enemies] * 360
+    alive = obs[..., 2::3][..., :n_enemies] == 1
+
+    # The target has the lowest distance * angle, dead enemies are never chosen
+    scores = dist * np.abs(angle)
+    scores[..., 1:] = np.where(alive, scores[..., 1:], 1000000)
+    targets = np.argmin(scores, axis=-1) # First lowest, so the base wins ties like in choose_action
+    target_dist = np.take_along_axis(dist, targets[..., None], axis=-1)[..., 0]
+    target_angle = np.take_along_axis(angle, targets[..., None], axis=-1)[..., 0]
+    aimed = np.abs(target_angle) < 20
+
+    if env.continuous_actions:
+        # choose_action draws a shot number only when in range, then 3 noise numbers, so agent by agent (row-major)
+        # that is 3 + in_range numbers. One draw of all of them, split at the offsets, gives the same stream.
+        in_range = (target_dist < env.shot_dist / 3 * 2) & aimed
+        counts = 3 + in_range.astype(np.int64).ravel()
+        rand = np.random.random_sample(counts.sum())
+        starts = np.cumsum(counts) - counts
+        shot = rand[starts].reshape(in_range.shape)
+        noise = rand[(starts + counts - 3)[:, None] + np.arange(3)].reshape(in_range.shape + (3,))
+
+        actions = np.zeros(obs.shape[:-1] + (3,))
+        actions[..., 2] = np.where(in_range, np.where(shot < 0.6, 1, -1), 0)
+        actions[..., 0] = target_dist / diagonal * 2 - 1
+        turn = -target_angle / env.max_turn
+        actions[..., 1] = np.where(target_angle > 0, np.maximum(turn, -1), np.minimum(turn, 1))
+        noise = -0.15 + (0.15 - -0.15) * noise # np.random.uniform(-0.15, 0.15) from the same numbers
+        return targets, np.clip(actions + noise, -1, 1)
+
+    actions = np.where((target_dist < env.shot_dist / 2) & aimed, 1, np.where(target_angle > 0, 3, 2))
+    return targets, actions
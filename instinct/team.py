@@ -1,15 +1,28 @@
-from instinct.agent import InstinctAgent
+import numpy as np
+from instinct.agent import InstinctAgent, instinct_actions
 
 class Team:
     def __init__(self, agent_list, enemy_list, env):
         self.agent_list = agent_list
         self.enemy_list = enemy_list
+        self.continuous_actions = env.continuous_actions
+        self.env = env
         self.agents = {}
         for idx, agent in enumerate(agent_list):
             self.agents[agent] = InstinctAgent(agent_list, enemy_list, env)
     
     def choose_actions(self, observations):
-        actions = {}
-        for agent_id, agent in self.agents.items():
-            actions[agent_id] = agent.choose_action(observations[agent_id])
-        return actions
\ No newline at end of file
+        obs = np.array([observations[agent_id] for agent_id in self.agent_list])
+        actions = self.choose_actions_batch(obs[None])[0]
+        return {agent_id: actions[idx] for idx, agent_id in enumerate(self.agent_list)}
+
+    def choose_actions_batch(self, observations):
+        """Chooses actions for the team in several games at once
+
+        Args:
+            observations (np.array): [n_envs, n_team, obs_size] observations in team order
+
+        Returns:
+            np.array: [n_envs, n_team] discrete actions or [n_envs, n_team, 3] continuous actions
+        """
+        return instinct_actions(observations, len(self.enemy_list), self.env)[1]
\ No newline at end of file
@@ -3,6 +3,22 @@ import torch as T
 import numpy as np
 from utils.noise import OUNoise
 
+def soft_update(params, target_params, tau):
+    """Moves target parameters toward the parameters in place: target = tau*param + (1-tau)*target
+
+    Args:
+        params (list): Parameters of the networks
+        target_params (list): Matching parameters of the target networks
+        tau (float): Fraction to move, 1 copies the parameters
+    """
+    with T.no_grad():
+        if tau == 1:
+            for target_param, param in zip(target_params, params):
+                target_param.copy_(param)
+            return
+        T._foreach_mul_(target_params, 1 - tau)
+        T._foreach_add_(target_params, params, alpha=tau)
+
 class NetworkedAgent: # An agent that is a part of a team
     def __init__(self, agent_list, n_actions, obs_len, name, n_agents, fc1_dims, fc2_dims, gamma, lr, chkpt_dir):
         self.agent_list = agent_list # List of all agents in the team
@@ -13,6 +29,7 @@ class NetworkedAgent: # An agent that is a part of a team
         self.gamma = gamma
         self.timestep = 0
         self.noise = OUNoise(self.n_actions) # Ornstein-Uhlenbeck noise
+        self.batch_noise = None # Noise for batched action selection, one process per env
 
         # Networks
         self.actor = ActorNetwork(obs_len, n_actions, fc1_dims, fc2_dims, lr, chkpt_dir, f'actor_{name}')
@@ -32,36 +49,50 @@ class NetworkedAgent: # An agent that is a part of a team
         self.actor.train()
         return actions.detach().cpu().numpy()
 
+    def choose_actions_batch(self, observations):
+        """Chooses actions for this agent in several games with a single forward pass
+
+        Args:
+            observations (np.array): [n_envs, obs_len] observations
+
+        Returns:
+            np.array: [n_envs, n_actions] actions
+        """
+        n_envs = observations.shape[0]
+        if self.batch_noise is None or self.batch_noise.state.shape[0] != n_envs:
+            self.batch_noise = OUNoise((n_envs, self.n_actions), scale=self.noise.scale)
+        with T.inference_mode():
+            state = T.as_tensor(observations, dtype=T.float, device=self.actor.device)
+            actions = self.actor(state)
+            actions += T.as_tensor(self.batch_noise.noise(), dtype=T.float, device=self.actor.device) # Add noise
+            actions = actions.clamp(-1, 1) # Ensure between -1 and 1
+        return actions.cpu().numpy()
+
+    def network_pairs(self):
+        """
+        Returns the parameters of the networks and of their target networks, in matching order
+        """
+        params = [*self.actor.parameters(), *self.critic.parameters()]
+        target_params = [*self.target_actor.parameters(), *self.target_critic.parameters()]
+        return params, target_params
+
     def update_network_parameters(self, tau=None):
         # Update the target networks with tau
         if tau is None:
             tau = self.tau
-        
-        actor_params = self.actor.named_parameters()
-        critic_params = self.critic.named_parameters()
-        target_actor_params = self.target_actor.named_parameters()
-        target_critic_params = self.target_critic.named_parameters()
-
-        actor_state_dict = dict(actor_params)
-        critic_state_dict = dict(critic_params)
-        target_actor_state_dict = dict(target_actor_params)
-        target_critic_state_dict = dict(target_critic_params)
-
-        for name in actor_state_dict:
-            actor_state_dict[name] = tau*actor_state_dict[name].clone() + (1-tau)*target_actor_state_dict[name].clone()
-
-        for name in critic_state_dict:
-            critic_state_dict[name] = tau*critic_state_dict[name].clone() + (1-tau)*target_critic_state_dict[name].clone()
-        
-        self.target_actor.load_state_dict(actor_state_dict)
-        self.target_critic.load_state_dict(critic_state_dict)
+        params, target_params = self.network_pairs()
+        soft_update(params, target_params, tau)
         
     # Deal with noise
     def reset_noise(self):
         self.noise.reset()
+        if self.batch_noise is not None:
+            self.batch_noise.reset()
         
     def scale_noise(self, scale):
         self.noise.scale = scale
+        if self.batch_noise is not None:
+            self.batch_noise.scale = scale
 
     # Save and load models
     def save_models(self):
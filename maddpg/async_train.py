@@ -0,0 +1,248 @@
+import collections
+import queue
+import random
+import numpy as np
+import torch as T
+import torch.multiprocessing as mp
+from maddpg.networks import ActorNetwork
+from utils.noise import OUNoise
+
+# Rollout workers play games with copies of the actors while the learner process (the one that owns the Team)
+# stores their transitions and trains. Workers send transitions in chunks through a queue and the learner
+# publishes new actor weights through shared memory.
+
+class SharedWeights:
+    """
+    Flat shared memory copy of every actor's parameters with a version counter
+    """
+    def __init__(self, params, ctx):
+        """Allocates the shared memory
+
+        Args:
+            params (list): Actor parameters in team order
+            ctx (multiprocessing context): Context the workers are started from
+        """
+        self.flat = T.zeros(sum(p.numel() for p in params)).share_memory_()
+        self.version = ctx.Value('i', 0, lock=False)
+        self.lock = ctx.Lock()
+
+    def publish(self, params):
+        """Copies the parameters into shared memory and increments the version
+
+        Args:
+            params (list): Actor parameters in team order
+        """
+        with T.no_grad(), self.lock:
+            self.flat.copy_(T.cat([p.detach().reshape(-1).cpu() for p in params]))
+            self.version.value += 1
+
+    def pull(self, params, version):
+        """Copies the shared parameters into params if they are newer than version
+
+        Args:
+            params (list): Actor parameters in team order
+            version (int): Version that params already hold
+
+        Returns:
+            int: The version params now hold
+        """
+        if self.version.value == version:
+            return version
+        with T.no_grad(), self.lock:
+            offset = 0
+            for p in params:
+                p.copy_(self.flat[offset:offset + p.numel()].view_as(p))
+                offset += p.numel()
+            return self.version.value
+
+def rollout_worker(worker_id, env_config, actor_config, weights, transitions, noise_scale, stop, seed, chunk_size):
+    """Plays games with the latest published actors and sends the transitions to the learner
+
+    Args:
+        worker_id (int): Index of the worker
+        env_config (dict): Keyword arguments for battle_env.parallel_env
+        actor_config (dict): obs_len, n_actions, fc1_dims and fc2_dims of the actors
+        weights (SharedWeights): Published actor weights
+        transitions (Queue): Queue to the learner
+        noise_scale (Value): Exploration noise scale, set by the learner
+        stop (Event): Set when the worker should exit
+        seed (int): Seed for the worker's random number generators
+        chunk_size (int): Number of steps sent per message
+    """
+    import envs.battle_env as battle_env
+    import instinct.team as instinct
+
+    T.set_num_threads(1) # Every worker gets its own core
+    random.seed(seed)
+    np.random.seed(seed)
+    T.manual_seed(seed)
+
+    env = battle_env.parallel_env(**dict(env_config, show=False))
+    n_red = len(env.possible_red)
+    blue_team = instinct.Team(env.possible_blue, env.possible_red, env)
+
+    # Actor copies on the CPU, built without an optimizer or touching CUDA
+    actors = [ActorNetwork(actor_config['obs_len'], actor_config['n_actions'], actor_config['fc1_dims'], actor_config['fc2_dims'], lr=None, name=f'actor_{agent}', device='cpu') for agent in env.possible_red]
+    params = [p for actor in actors for p in actor.parameters()]
+    version = weights.pull(params, -1)
+    noise = OUNoise((n_red, env.n_actions)) # One noise process per agent
+
+    def send(message):
+        # Blocks while the learner is behind, but still notices the stop event
+        while not stop.is_set():
+            try:
+                transitions.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    while not stop.is_set():
+        observations = env.reset_arrays()
+        noise.scale = noise_scale.value
+        noise.reset()
+        chunk = []
+        red_score = 0
+        blue_score = 0
+        n_steps = 0
+
+        while not env.env_done and not stop.is_set():
+            version = weights.pull(params, version)
+
+            # Red actions from the actor copies, blue actions from the instinct agents
+            with T.inference_mode():
+                states = T.as_tensor(observations[:n_red])
+                red_actions = T.stack([actor(states[idx]) for idx, actor in enumerate(actors)]).numpy()
+            red_actions = np.clip(red_actions + noise.noise(), -1, 1).astype(np.float32)
+            blue_actions = blue_team.choose_actions_batch(observations[None, n_red:])[0]
+            if env.continuous_actions:
+                actions = np.concatenate([red_actions, blue_actions])
+            else:
+                actions = np.concatenate([np.argmax(red_actions, axis=1), blue_actions])
+
+            observations_, rewards, dones = env.step_arrays(actions)
+            red_score += rewards[:n_red].sum()
+            blue_score += rewards[n_red:].sum()
+            n_steps += 1
+
+            # The env reuses its buffers, so everything sent is copied
+            chunk.append((observations[:n_red].copy(), red_actions, rewards[:n_red].copy(), observations_[:n_red].copy(), dones[:n_red].copy()))
+            if len(chunk) == chunk_size:
+                send((worker_id, [np.stack(x) for x in zip(*chunk)], None))
+                chunk = []
+            observations = observations_
+
+        result = (red_score, blue_score, env.winner, n_steps) if env.env_done else None
+        send((worker_id, [np.stack(x) for x in zip(*chunk)] if chunk else None, result))
+
+class AsyncTrainer:
+    """
+    Trains a maddpg Team in this process from games played by rollout worker processes
+    """
+    def __init__(self, team, env_config, n_workers, utd_ratio, publish_interval=1, chunk_size=64, queue_size=64, seed=0):
+        """Starts the rollout workers
+
+        Args:
+            team (maddpg.Team): The team to train, its networks and memory stay in this process
+            env_config (dict): Keyword arguments for battle_env.parallel_env
+            n_workers (int): Number of rollout worker processes
+            utd_ratio (float): Updates per environment step (1 / learn_interval matches the synchronous loop)
+            publish_interval (int, optional): Updates between publishing actor weights to the workers. Defaults to 1.
+            chunk_size (int, optional): Steps per message from a worker. Defaults to 64.
+            queue_size (int, optional): Messages the queue holds before the workers wait for the learner. Defaults to 64.
+            seed (int, optional): Base seed of the workers. Defaults to 0.
+        """
+        if not team.agents:
+            raise ValueError('AsyncTrainer needs a Team with an actor per agent')
+        self.team = team
+        self.utd_ratio = utd_ratio
+        self.publish_interval = publish_interval
+        self.env_steps = 0 # Transitions received
+        self.n_updates = 0
+        self.results = collections.deque() # Finished games that haven't been handed out
+
+        ctx = mp.get_context('spawn') # Forking a process that already uses torch isn't safe
+        agents = [team.agents[agent_id] for agent_id in team.agent_list]
+        self.params = [p for agent in agents for p in agent.actor.parameters()]
+        self.weights = SharedWeights(self.params, ctx)
+        self.weights.publish(self.params)
+        self.transitions = ctx.Queue(queue_size)
+        self.noise_scale = ctx.Value('d', 0.0, lock=False)
+        self.stop = ctx.Event()
+
+        actor = agents[0].actor
+        actor_config = {
+            'obs_len': actor.fc1.in_features,
+            'n_actions': actor.pi.out_features,
+            'fc1_dims': actor.fc1.out_features,
+            'fc2_dims': actor.fc2.out_features
+        }
+        self.workers = []
+        for worker_id in range(n_workers):
+            worker = ctx.Process(target=rollout_worker, args=(worker_id, env_config, actor_config, self.weights, self.transitions, self.noise_scale, self.stop, seed + worker_id, chunk_size), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def set_noise(self, scale):
+        """Sets the exploration noise scale the workers use for their next games
+
+        Args:
+            scale (float): Noise scale
+        """
+        self.noise_scale.value = scale
+
+    def next_game(self):
+        """Trains until a worker finishes a game
+
+        Returns:
+            float: Red team score
+            float: Blue team score
+            string: Winner, 'red', 'blue', or 'tie'
+            int: Number of steps in the game
+        """
+        while not self.results:
+            self.collect()
+        return self.results.popleft()
+
+    def collect(self, timeout=1.0):
+        """Stores one message of transitions from the workers and runs the updates that are due
+
+        Args:
+            timeout (float, optional): Seconds between checks that the workers are still running while waiting. Defaults to 1.0.
+        """
+        while True:
+            try:
+                worker_id, chunk, result = self.transitions.get(timeout=timeout)
+                break
+            except queue.Empty: # A worker that crashed never sends anything, so don't wait on it forever
+                for worker_id, worker in enumerate(self.workers):
+                    if not worker.is_alive():
+                        raise RuntimeError(f'Rollout worker {worker_id} exited with code {worker.exitcode}')
+        if chunk is not None:
+            self.team.memory.store_batch(*chunk)
+            self.env_steps += len(chunk[0])
+        if result is not None:
+            self.results.append(result)
+        self.train()
+
+    def train(self):
+        """
+        Runs updates until there have been utd_ratio updates per environment step, publishing the actors on the way
+        """
+        while self.team.memory.is_ready() and self.n_updates < self.env_steps * self.utd_ratio:
+            self.team.learn()
+            self.n_updates += 1
+            if self.n_updates % self.publish_interval == 0:
+                self.weights.publish(self.params)
+
+    def close(self):
+        """
+        Stops the workers
+        """
+        self.stop.set()
+        while any(worker.is_alive() for worker in self.workers):
+            try: # Keep the queue drained so no worker is stuck putting
+                self.transitions.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for worker in self.workers:
+            worker.join()
@@ -1,70 +1,291 @@
+import os
+import json
+import threading
 import numpy as np
 
+def open_array(path, shape, dtype):
+    """Opens a .npy file as a memory map, creating it if it doesn't exist or doesn't match
+
+    Args:
+        path (string): Path to the .npy file
+        shape (tuple): Shape of the array
+        dtype (np.dtype): Type of the array
+
+    Returns:
+        np.memmap: The array, backed by the file
+        bool: If the existing file was reused
+    """
+    if os.path.exists(path):
+        array = np.lib.format.open_memmap(path, mode='r+')
+        if array.shape == tuple(shape) and array.dtype == dtype:
+            return array, True
+        del array
+    return np.lib.format.open_memmap(path, mode='w+', shape=shape, dtype=dtype), False
+
 class ReplayBuffer:
-    def __init__(self, mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions):
+    prioritized = False # If sample() also returns importance sampling weights and indices
+
+    def __init__(self, mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions, path=None):
+        """Initializes the memory
+
+        Args:
+            mem_size (int): Number of transitions to keep
+            batch_size (int): Number of transitions per sample
+            agent_list (list): Names of the agents in the team
+            obs_size (int): Length of each agent's observation
+            critic_dims (int): Length of the critic's state input
+            n_actions (int): Length of each agent's action vector
+            path (string, optional): Folder to keep the memory in as memory mapped files so it persists between runs. Defaults to None (in RAM).
+        """
         self.mem_size = mem_size
         self.mem_cntr = 0
+        self.path = path
+        self.lock = threading.RLock() # Held while storing and sampling, so a background sampler never sees half a transition
         self.batch_size = batch_size
         self.agent_list = agent_list
         self.n_agents = len(agent_list)
+        self.critic_dims = critic_dims # The critic's input is every agent's observation concatenated
+
+        # Each observation is stored once in float32, the critic's view is a reshape at sample time
+        # Actions are the actor's output vectors in both action modes (the critic trains on them), so they stay float32
+        shapes = {
+            'obs_mem': ((self.mem_size, self.n_agents, obs_size), np.float32),
+            'new_obs_mem': ((self.mem_size, self.n_agents, obs_size), np.float32),
+            'action_mem': ((self.mem_size, self.n_agents, n_actions), np.float32),
+            'rew_mem': ((self.mem_size, self.n_agents), np.float32),
+            'done_mem': ((self.mem_size, self.n_agents), bool),
+        }
 
-        self.state_mem = np.zeros((self.mem_size, critic_dims))
-        self.new_state_mem = np.zeros((self.mem_size, critic_dims))
-        self.rew_mem = np.zeros((self.mem_size, self.n_agents))
-        self.done_mem = np.zeros((self.mem_size, self.n_agents), dtype=bool)
+        if path is None:
+            for name, (shape, dtype) in shapes.items():
+                setattr(self, name, np.zeros(shape, dtype=dtype))
+            return
 
-        self.actor_states = []
-        self.actor_new_states = []
-        self.action_mem = []
+        # Memory mapped files are only paged in when they are used
+        os.makedirs(path, exist_ok=True)
+        reused = True
+        for name, (shape, dtype) in shapes.items():
+            array, existed = open_array(os.path.join(path, f'{name}.npy'), shape, np.dtype(dtype))
+            setattr(self, name, array)
+            reused = reused and existed
 
-        for agent in agent_list:
-            self.actor_states.append(np.zeros((self.mem_size, obs_size)))
-            self.actor_new_states.append(np.zeros((self.mem_size, obs_size)))
-            self.action_mem.append(np.zeros((self.mem_size, n_actions)))
+        meta_path = os.path.join(path, 'meta.json')
+        if reused and os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                self.mem_cntr = json.load(f)['mem_cntr']
 
     def store_transition(self, states, actions, rewards, states_, dones):
-        index = self.mem_cntr % self.mem_size
-        # print(f"states: {states}\nactions: {actions}\nrewards: {rewards}\nstates_: {states_}\ndones: {dones}")
-        _states = np.array([])
-        _new_states = np.array([])
-        _rewards = np.array([])
-        _dones = np.array([], dtype=bool)
-        for idx, agent in enumerate(self.agent_list):
-            _states = np.concatenate([_states, states[agent]])
-            _new_states = np.concatenate([_new_states, states_[agent]])
-            _rewards = np.append(_rewards, rewards[agent])
-            _dones = np.append(_dones, dones[agent])
-
-            self.actor_states[idx][index] = states[agent]
-            self.actor_new_states[idx][index] = states_[agent]
-            self.action_mem[idx][index] = actions[agent]
-
-        self.state_mem[index] = _states
-        self.new_state_mem[index] = _new_states
-        self.rew_mem[index] = _rewards
-        self.done_mem[index] = _dones
-
-        self.mem_cntr += 1
+        # Dicts keyed by agent are stacked in the order of agent_list
+        self.store_arrays(np.array([states[agent] for agent in self.agent_list]),
+                          np.array([np.reshape(actions[agent], -1) for agent in self.agent_list]),
+                          np.array([rewards[agent] for agent in self.agent_list]),
+                          np.array([states_[agent] for agent in self.agent_list]),
+                          np.array([dones[agent] for agent in self.agent_list]))
+
+    def store_arrays(self, states, actions, rewards, states_, dones):
+        # All arrays are indexed by agent in the order of agent_list
+        with self.lock:
+            index = self.mem_cntr % self.mem_size
+
+            self.obs_mem[index] = states
+            self.new_obs_mem[index] = states_
+            self.action_mem[index] = actions
+            self.rew_mem[index] = rewards
+            self.done_mem[index] = dones
+
+            self.mem_cntr += 1
+
+    def store_batch(self, states, actions, rewards, states_, dones):
+        """Stores several transitions at once
+
+        Args:
+            states (np.array): [n, n_agents, obs_size] observations
+            actions (np.array): [n, n_agents, n_actions] actions
+            rewards (np.array): [n, n_agents] rewards
+            states_ (np.array): [n, n_agents, obs_size] next observations
+            dones (np.array): [n, n_agents] dones
+
+        Returns:
+            np.array: The indices the transitions were stored at
+        """
+        with self.lock:
+            indices = (self.mem_cntr + np.arange(len(states))) % self.mem_size
+
+            self.obs_mem[indices] = states
+            self.new_obs_mem[indices] = states_
+            self.action_mem[indices] = actions
+            self.rew_mem[indices] = rewards
+            self.done_mem[indices] = dones
+
+            self.mem_cntr += len(states)
+        return indices
 
     def sample(self):
-        max_mem = min(self.mem_cntr, self.mem_size) # makes sure we only sample the filled data
-        batch = np.random.choice(max_mem, self.batch_size)
+        with self.lock:
+            max_mem = min(self.mem_cntr, self.mem_size) # makes sure we only sample the filled data
+            batch = np.random.choice(max_mem, self.batch_size)
+            return self.gather(batch)
+
+    def gather(self, batch):
+        """Collects the transitions at the given indices
+
+        Args:
+            batch (np.array): Indices into the memory
 
-        states = self.state_mem[batch]
-        states_ = self.new_state_mem[batch]
+        Returns:
+            tuple: actor_states, states, actions, rewards, actor_new_states, states_, dones
+        """
+        obs = self.obs_mem[batch]
+        obs_ = self.new_obs_mem[batch]
         rewards = self.rew_mem[batch]
         dones = self.done_mem[batch]
 
-        actor_states = []
-        actor_new_states = []
-        actions = []
+        # Per agent views are [n_agents, batch, ...], the critic views are [batch, critic_dims]
+        actor_states = obs.transpose(1, 0, 2)
+        actor_new_states = obs_.transpose(1, 0, 2)
+        actions = self.action_mem[batch].transpose(1, 0, 2)
+        states = obs.reshape(self.batch_size, self.critic_dims)
+        states_ = obs_.reshape(self.batch_size, self.critic_dims)
 
-        for i in range(self.n_agents):
-            actor_states.append(self.actor_states[i][batch])
-            actor_new_states.append(self.actor_new_states[i][batch])
-            actions.append(self.action_mem[i][batch])
-
-        return np.array(actor_states), states, np.array(actions), rewards, np.array(actor_new_states), states_, dones
+        return actor_states, states, actions, rewards, actor_new_states, states_, dones
 
     def is_ready(self):
-        return self.mem_cntr >= self.batch_size
\ No newline at end of file
+        return self.mem_cntr >= self.batch_size
+
+    def save(self):
+        """
+        Flushes the memory mapped files and records how many transitions they hold
+        """
+        if self.path is None:
+            return
+        for mem in (self.obs_mem, self.new_obs_mem, self.action_mem, self.rew_mem, self.done_mem):
+            mem.flush()
+
+        # Write the counter last and atomically, so it never counts transitions that aren't on disk
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            f.write(json.dumps({'mem_cntr': self.mem_cntr}))
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def nbytes(self):
+        """
+        Returns the number of bytes allocated for the stored transitions
+        """
+        return sum(mem.nbytes for mem in (self.obs_mem, self.new_obs_mem, self.action_mem, self.rew_mem, self.done_mem))
+
+class SumTree:
+    """
+    Binary tree where every node holds the sum of its children
+    Batches of leaves are updated and searched with one vectorized pass per level, O(log n) each
+    """
+    def __init__(self, capacity):
+        self.capacity = 1 << max(0, int(capacity - 1).bit_length()) # Leaves, rounded up to a power of 2
+        self.depth = self.capacity.bit_length() - 1
+        self.tree = np.zeros(2 * self.capacity) # Node 1 is the root, leaves start at self.capacity
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, indices, values):
+        """Sets leaf values and updates the sums above them
+
+        Args:
+            indices (np.array): Leaf indices
+            values (np.array): New leaf values
+        """
+        nodes = np.asarray(indices) + self.capacity
+        self.tree[nodes] = values
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """Finds the leaves whose cumulative sum ranges contain the values
+
+        Args:
+            values (np.array): Values between 0 and total()
+
+        Returns:
+            np.array: Leaf indices
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.capacity
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer that samples transitions in proportion to their priority (https://arxiv.org/abs/1511.05952)
+    """
+    prioritized = True
+
+    def __init__(self, mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions, path=None, alpha=0.6, beta=0.4, beta_increment=0.0, eps=1e-5):
+        """Initializes the memory and the priorities
+
+        Args:
+            alpha (float, optional): How strongly priorities skew sampling, 0 is uniform. Defaults to 0.6.
+            beta (float, optional): Importance sampling correction, 1 corrects fully. Defaults to 0.4.
+            beta_increment (float, optional): Amount beta grows after every sample, up to 1. Defaults to 0.0.
+            eps (float, optional): Added to every priority so every transition can still be sampled. Defaults to 1e-5.
+        """
+        super().__init__(mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions, path)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0 # New transitions get the highest priority seen so they are sampled at least once
+        self.tree = SumTree(mem_size)
+
+        # Priorities aren't saved, so transitions from a resumed memory start out equal
+        filled = min(self.mem_cntr, self.mem_size)
+        if filled > 0:
+            self.tree.update(np.arange(filled), np.full(filled, self.max_priority ** self.alpha))
+
+    def store_arrays(self, states, actions, rewards, states_, dones):
+        with self.lock:
+            index = self.mem_cntr % self.mem_size
+            super().store_arrays(states, actions, rewards, states_, dones)
+            self.tree.update([index], [self.max_priority ** self.alpha])
+
+    def store_batch(self, states, actions, rewards, states_, dones):
+        with self.lock:
+            indices = super().store_batch(states, actions, rewards, states_, dones)
+            self.tree.update(indices, np.full(len(indices), self.max_priority ** self.alpha))
+        return indices
+
+    def sample(self):
+        """Samples a batch in proportion to the priorities
+
+        Returns:
+            tuple: The same values as ReplayBuffer.sample, then the importance sampling weights and the indices of the batch
+        """
+        with self.lock:
+            max_mem = min(self.mem_cntr, self.mem_size)
+
+            # One value from each of batch_size equal segments of the total priority
+            segment = self.tree.total() / self.batch_size
+            values = (np.arange(self.batch_size) + np.random.random(self.batch_size)) * segment
+            batch = np.minimum(self.tree.find(values), max_mem - 1) # Guard against rounding past the filled leaves
+
+            probs = self.tree.tree[batch + self.tree.capacity] / self.tree.total()
+            weights = (max_mem * probs) ** -self.beta
+            weights /= weights.max()
+            self.beta = min(1.0, self.beta + self.beta_increment)
+
+            return (*self.gather(batch), weights.astype(np.float32), batch)
+
+    def update_priorities(self, indices, td_errors):
+        """Sets the priorities of sampled transitions from their TD errors
+
+        Args:
+            indices (np.array): Indices returned by sample()
+            td_errors (np.array): Absolute TD error of each transition
+        """
+        priorities = np.abs(td_errors) + self.eps
+        with self.lock:
+            self.max_priority = max(self.max_priority, priorities.max())
+            self.tree.update(indices, priorities ** self.alpha)
@@ -0,0 +1,201 @@
+import os
+import re
+import copy
+import queue
+import random
+import threading
+import numpy as np
+import torch as T
+
+# A checkpoint is one file holding every network, optimizer and noise process of a team, the training params,
+# and the random number generator states. Files are written by a background thread from a CPU snapshot, to a
+# temporary file that is renamed over the final name, so a crash while saving never leaves a broken checkpoint.
+
+CHECKPOINT_DIR = 'checkpoints' # Folder inside the model folder
+CHECKPOINT_RE = re.compile(r'ckpt_(\d+)\.pt$')
+
+def to_cpu(obj):
+    """Copies every tensor in a nested structure to the CPU
+
+    Args:
+        obj (any): Tensor, dict, list, tuple, or other value
+
+    Returns:
+        any: The same structure with copied tensors
+    """
+    if isinstance(obj, T.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    return copy.deepcopy(obj)
+
+def snapshot(team, params=None):
+    """Copies the state of a team to the CPU
+
+    Args:
+        team (Team): The team, which has networks() and noises()
+        params (dict, optional): Training params to store with the checkpoint. Defaults to None.
+
+    Returns:
+        dict: The checkpoint
+    """
+    networks = team.networks()
+    rng = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': T.get_rng_state()
+    }
+    if T.cuda.is_available():
+        rng['cuda'] = T.cuda.get_rng_state_all()
+    return {
+        'networks': {name: to_cpu(network.state_dict()) for name, network in networks.items()},
+        'optimizers': {name: to_cpu(network.optimizer.state_dict()) for name, network in networks.items()},
+        'noise': {name: (noise.state.copy(), noise.scale) for name, noise in team.noises().items()},
+        'params': copy.deepcopy(params),
+        'rng': rng
+    }
+
+def restore(team, checkpoint):
+    """Loads a checkpoint into a team
+
+    Args:
+        team (Team): The team
+        checkpoint (dict): A checkpoint from snapshot()
+
+    Returns:
+        dict: The params stored with the checkpoint
+    """
+    for name, network in team.networks().items():
+        network.load_state_dict(checkpoint['networks'][name])
+        network.optimizer.load_state_dict(checkpoint['optimizers'][name])
+    noises = team.noises()
+    for name, (state, scale) in checkpoint['noise'].items():
+        if name in noises and noises[name].state.shape == state.shape:
+            noises[name].state = state.copy()
+            noises[name].scale = scale
+
+    rng = checkpoint['rng']
+    random.setstate(rng['python'])
+    np.random.set_state(rng['numpy'])
+    T.set_rng_state(rng['torch'])
+    if 'cuda' in rng and T.cuda.is_available():
+        T.cuda.set_rng_state_all(rng['cuda'])
+    return checkpoint['params']
+
+def list_checkpoints(folder):
+    """Finds the checkpoints in a folder
+
+    Args:
+        folder (string): Folder holding the checkpoints
+
+    Returns:
+        list: (number, path) of every checkpoint, oldest first
+    """
+    if not os.path.isdir(folder):
+        return []
+    found = []
+    for name in os.listdir(folder):
+        match = CHECKPOINT_RE.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(folder, name)))
+    return sorted(found)
+
+def load_file(path):
+    """
+    Reads a checkpoint file onto the CPU
+    """
+    try:
+        return T.load(path, map_location='cpu', weights_only=False)
+    except TypeError: # torch before 1.13 has no weights_only
+        return T.load(path, map_location='cpu')
+
+def latest_checkpoint(chkpt_dir):
+    """
+    Returns the path of the newest checkpoint in a model folder, or None
+    """
+    found = list_checkpoints(os.path.join(chkpt_dir, CHECKPOINT_DIR))
+    return found[-1][1] if found else None
+
+class Checkpointer:
+    """
+    Writes checkpoints in a background thread and removes old ones
+    """
+    def __init__(self, chkpt_dir, keep_last=3, keep_every=10):
+        """Starts the writing thread
+
+        Args:
+            chkpt_dir (string): The model folder, checkpoints go in its checkpoints folder
+            keep_last (int, optional): Number of newest checkpoints to keep. Defaults to 3.
+            keep_every (int, optional): Also keep every checkpoint whose number is a multiple of this, 0 keeps none. Defaults to 10.
+        """
+        self.folder = os.path.join(chkpt_dir, CHECKPOINT_DIR)
+        os.makedirs(self.folder, exist_ok=True)
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        found = list_checkpoints(self.folder)
+        self.number = found[-1][0] if found else 0 # Number of the last checkpoint
+        self.error = None # Exception from the writing thread, raised on the next save
+
+        self.pending = queue.Queue(maxsize=1) # At most one snapshot waits while another is written
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def save(self, team, params=None):
+        """Snapshots the team and queues it to be written
+
+        Args:
+            team (Team): The team
+            params (dict, optional): Training params to store with the checkpoint. Defaults to None.
+        """
+        if self.error is not None:
+            raise self.error
+        self.number += 1
+        self.pending.put((self.number, snapshot(team, params)))
+
+    def run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                self.pending.task_done()
+                break
+            number, checkpoint = item
+            try:
+                self.write(number, checkpoint)
+                self.prune()
+            except Exception as e:
+                self.error = e
+            self.pending.task_done()
+
+    def write(self, number, checkpoint):
+        path = os.path.join(self.folder, f'ckpt_{number:06d}.pt')
+        with open(path + '.tmp', 'wb') as f:
+            T.save(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def prune(self):
+        found = list_checkpoints(self.folder)
+        for number, path in found[:-self.keep_last] if self.keep_last > 0 else found:
+            if self.keep_every > 0 and number % self.keep_every == 0:
+                continue
+            os.remove(path)
+
+    def wait(self):
+        """
+        Waits until every queued checkpoint is written
+        """
+        self.pending.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Writes the queued checkpoints and stops the thread
+        """
+        self.pending.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
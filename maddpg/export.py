@@ -0,0 +1,90 @@
+import envs.battle_env as battle_env
+import maddpg.team as maddpg
+import maddpg.shared_team as shared_team
+from maddpg.numpy_actor import NumpyPolicy
+import numpy as np
+import torch as T
+import json
+import os
+import sys
+import time
+
+def export_actors(team, path):
+    """Writes the actors of a team to an .npz file for maddpg.numpy_actor
+
+    Args:
+        team (Team or SharedTeam): The trained team
+        path (string): Path of the .npz file
+    """
+    shared = isinstance(team, shared_team.SharedTeam)
+    actors = {'shared': team.actor} if shared else {agent_id: team.agents[agent_id].actor for agent_id in team.agent_list}
+    arrays = {
+        'agents': np.array(team.agent_list),
+        'shared': np.array(shared),
+        'eps': np.array(next(iter(actors.values())).bn1.eps)
+    }
+    for name, actor in actors.items():
+        for key, value in actor.state_dict().items():
+            arrays[f'{name}/{key}'] = value.detach().cpu().numpy()
+    np.savez(path, **arrays)
+
+def compare(team, policy, observations):
+    """Finds the largest difference between the torch actors and the exported actors
+
+    Args:
+        team (Team or SharedTeam): The trained team
+        policy (NumpyPolicy): The exported actors
+        observations (np.array): [n, n_team, obs_size] observations to compare on
+
+    Returns:
+        float: Largest absolute difference between the actions
+    """
+    with T.inference_mode():
+        obs = T.as_tensor(observations, dtype=T.float, device=T.device('cpu'))
+        if isinstance(team, shared_team.SharedTeam):
+            actions = team.act(team.actor.cpu(), obs)
+        else:
+            actions = T.stack([team.agents[agent_id].actor.cpu()(obs[:, idx]) for idx, agent_id in enumerate(team.agent_list)], dim=1)
+    return np.abs(actions.numpy() - policy.choose_actions_batch(observations)).max()
+
+def main():
+    model_name = input('Enter model name: ')
+    FOLDER = f'models/{model_name}'
+    if not os.path.exists(FOLDER):
+        print('Model does not exist')
+        sys.exit()
+
+    with open(f'{FOLDER}/params.json', 'r') as f:
+        params = json.load(f)
+    with open(f'{FOLDER}/cf.json', 'r') as f:
+        env_config = json.load(f)
+    env_config['show'] = False
+
+    env = battle_env.parallel_env(**env_config)
+    red_agent_list = env.possible_red
+    obs_len = env.observation_space(red_agent_list[0]).shape[0]
+    critic_dims = obs_len * env.n_agents
+
+    # Only the actors are exported, a small buffer is enough to build the team
+    team_class = shared_team.SharedTeam if params.get('shared_networks', False) else maddpg.Team
+    red_team = team_class(red_agent_list, obs_len, env.n_actions, critic_dims, params['fc1_dims'], params['fc2_dims'], params['batch_size'], params['batch_size'], params['gamma'], params['lr'], FOLDER)
+    red_team.load_models()
+
+    path = f'{FOLDER}/actors.npz'
+    export_actors(red_team, path)
+
+    # Time loading the file and choosing the first action
+    start = time.perf_counter()
+    policy = NumpyPolicy(path)
+    policy.choose_actions_batch(np.zeros((1, len(red_agent_list), obs_len)))
+    load_ms = (time.perf_counter() - start) * 1000
+
+    observations = np.random.uniform(-1, 1, (1000, len(red_agent_list), obs_len))
+    error = compare(red_team, policy, observations)
+
+    print(f'Exported to {path} ({os.path.getsize(path) / 1024:.1f} KB)')
+    print(f'Max difference from torch: {error:.2e}')
+    print(f'Load and first action: {load_ms:.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -12,10 +12,10 @@ import numpy as np
 # Paper:
 # https://arxiv.org/pdf/1706.02275v4.pdf
 class CriticNetwork(nn.Module):
-    def __init__(self, obs_len, n_actions, n_agents, fc1_dims, fc2_dims, lr, chkpt_dir='tmp/maddpg', name='critic'):
+    def __init__(self, obs_len, n_actions, n_agents, fc1_dims, fc2_dims, lr, chkpt_dir='tmp/maddpg', name='critic', id_dims=0):
         super(CriticNetwork, self).__init__()
         
-        self.fc1 = nn.Linear(obs_len*n_agents+n_actions*n_agents, fc1_dims) # Takes in observations from all teammates
+        self.fc1 = nn.Linear(obs_len*n_agents+n_actions*n_agents+id_dims, fc1_dims) # Takes in observations from all teammates, and an agent ID when the critic is shared
         f1 = 1./np.sqrt(self.fc1.weight.data.size()[0]) 
         T.nn.init.uniform_(self.fc1.weight.data, -f1, f1)
         T.nn.init.uniform_(self.fc1.bias.data, -f1, f1)
@@ -37,8 +37,8 @@ class CriticNetwork(nn.Module):
         self.device = T.device('cuda:0' if T.cuda.is_available() else 'cpu') # Use GPU if available
         self.to(self.device)
 
-    def forward(self, obs, actions):
-        x = T.cat([obs, actions], dim=1) # Concatenate observations and actions to calculate Q-value
+    def forward(self, obs, actions, ids=None):
+        x = T.cat([obs, actions] if ids is None else [obs, actions, ids], dim=-1) # Concatenate observations and actions to calculate Q-value
         x = F.relu(self.bn1(self.fc1(x)))
         x = F.relu(self.bn2(self.fc2(x)))
         x = self.q(x)
@@ -52,7 +52,7 @@ class CriticNetwork(nn.Module):
         self.load_state_dict(T.load(self.checkpoint_file))
 
 class ActorNetwork(nn.Module):
-    def __init__(self, obs_len, n_actions, fc1_dims=64, fc2_dims=64, lr=0.001, chkpt_dir='tmp/maddpg', name='actor'):
+    def __init__(self, obs_len, n_actions, fc1_dims=64, fc2_dims=64, lr=0.001, chkpt_dir='tmp/maddpg', name='actor', device=None):
         super(ActorNetwork, self).__init__()
         
         self.fc1 = nn.Linear(obs_len, fc1_dims) # Only takes agent's own observations
@@ -74,8 +74,10 @@ class ActorNetwork(nn.Module):
         self.pi.weight.data.uniform_(-3e-3, 3e-3)
         
         self.checkpoint_file = os.path.join(chkpt_dir, name)
-        self.optimizer = optim.Adam(self.parameters(), lr=lr)
-        self.device = T.device('cuda:0' if T.cuda.is_available() else 'cpu') # Use GPU if available
+        self.optimizer = optim.Adam(self.parameters(), lr=lr) if lr is not None else None # No optimizer for an inference-only copy
+        if device is None:
+            device = 'cuda:0' if T.cuda.is_available() else 'cpu' # Use GPU if available
+        self.device = T.device(device)
         self.to(self.device)
 
     def forward(self, obs):
@@ -0,0 +1,103 @@
+import numpy as np
+
+# Runs exported actors (see maddpg/export.py) with NumPy only, so playing a trained model doesn't need torch
+
+def layer_norm(x, weight, bias, eps):
+    """LayerNorm over the last axis, like torch.nn.LayerNorm
+
+    Args:
+        x (np.array): [..., features] inputs
+        weight (np.array): [features] scale
+        bias (np.array): [features] shift
+        eps (float): Added to the variance
+
+    Returns:
+        np.array: The normalized inputs
+    """
+    # Sums instead of mean()/var(), which have a lot of overhead for small arrays
+    n = x.shape[-1]
+    centered = x - x.sum(axis=-1, keepdims=True) / n
+    var = (centered * centered).sum(axis=-1, keepdims=True) / n
+    return centered / np.sqrt(var + eps) * weight + bias
+
+class NumpyActor:
+    """
+    Forward pass of maddpg.networks.ActorNetwork: Linear -> LayerNorm -> ReLU, twice, then Linear -> tanh
+    """
+    def __init__(self, weights, eps=1e-5):
+        """Takes the weights of one actor
+
+        Args:
+            weights (dict): The actor's state_dict as NumPy arrays
+            eps (float, optional): LayerNorm epsilon. Defaults to 1e-5 (the torch default).
+        """
+        # Weights are transposed once so the forward pass is x @ w
+        self.w1 = np.ascontiguousarray(weights['fc1.weight'].T, dtype=np.float32)
+        self.b1 = weights['fc1.bias'].astype(np.float32)
+        self.g1 = weights['bn1.weight'].astype(np.float32)
+        self.beta1 = weights['bn1.bias'].astype(np.float32)
+        self.w2 = np.ascontiguousarray(weights['fc2.weight'].T, dtype=np.float32)
+        self.b2 = weights['fc2.bias'].astype(np.float32)
+        self.g2 = weights['bn2.weight'].astype(np.float32)
+        self.beta2 = weights['bn2.bias'].astype(np.float32)
+        self.w3 = np.ascontiguousarray(weights['pi.weight'].T, dtype=np.float32)
+        self.b3 = weights['pi.bias'].astype(np.float32)
+        self.eps = eps
+        self.obs_len = self.w1.shape[0]
+        self.n_actions = self.w3.shape[1]
+
+    def __call__(self, obs):
+        """Runs the actor
+
+        Args:
+            obs (np.array): [..., obs_len] observations
+
+        Returns:
+            np.array: [..., n_actions] actions between -1 and 1
+        """
+        x = np.asarray(obs, dtype=np.float32) @ self.w1 + self.b1
+        x = np.maximum(layer_norm(x, self.g1, self.beta1, self.eps), 0)
+        x = x @ self.w2 + self.b2
+        x = np.maximum(layer_norm(x, self.g2, self.beta2, self.eps), 0)
+        return np.tanh(x @ self.w3 + self.b3)
+
+class NumpyPolicy:
+    """
+    The exported actors of a team, choosing actions without noise
+    """
+    def __init__(self, path):
+        """Loads an exported .npz file
+
+        Args:
+            path (string): Path to the file written by maddpg.export.export_actors
+        """
+        with np.load(path) as data:
+            self.agent_list = [str(agent) for agent in data['agents']]
+            self.shared = bool(data['shared']) # One actor for every agent, with a one-hot agent ID
+            eps = float(data['eps'])
+            names = ['shared'] if self.shared else self.agent_list
+            self.actors = []
+            for name in names:
+                weights = {key.split('/', 1)[1]: data[key] for key in data.files if key.startswith(f'{name}/')}
+                self.actors.append(NumpyActor(weights, eps))
+        self.ids = np.eye(len(self.agent_list), dtype=np.float32)
+
+    def choose_actions_batch(self, observations):
+        """Chooses actions for the team in several games at once
+
+        Args:
+            observations (np.array): [n_envs, n_team, obs_size] observations in team order
+
+        Returns:
+            np.array: [n_envs, n_team, n_actions] actions
+        """
+        observations = np.asarray(observations, dtype=np.float32)
+        if self.shared:
+            ids = np.broadcast_to(self.ids, (observations.shape[0], *self.ids.shape))
+            return self.actors[0](np.concatenate([observations, ids], axis=-1))
+        return np.stack([actor(observations[:, idx]) for idx, actor in enumerate(self.actors)], axis=1)
+
+    def choose_actions(self, observations):
+        obs = np.array([observations[agent] for agent in self.agent_list])
+        actions = self.choose_actions_batch(obs[None])[0]
+        return {agent: actions[idx] for idx, agent in enumerate(self.agent_list)}
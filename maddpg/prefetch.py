@@ -0,0 +1,99 @@
+import queue
+import threading
+import time
+import numpy as np
+import torch as T
+
+class BatchPrefetcher:
+    """
+    Samples minibatches from a replay buffer in a background thread
+    Batches are converted to contiguous float32 tensors (pinned when training on a GPU) so learn() only has to take them
+    """
+    def __init__(self, memory, depth, device):
+        """Starts the sampling thread
+
+        Args:
+            memory (ReplayBuffer): The buffer to sample from
+            depth (int): Number of batches to keep ready
+            device (torch.device): Device the batches are used on
+        """
+        self.memory = memory
+        self.device = T.device(device)
+        self.pin = self.device.type == 'cuda' # Pinned memory makes the copies to the GPU asynchronous
+        self.batches = queue.Queue(maxsize=depth)
+
+        # Metrics
+        self.n_batches = 0 # Batches taken
+        self.total_depth = 0 # Sum of the ready batches each time one was taken
+        self.stall_time = 0.0 # Seconds spent waiting for a batch
+
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def to_tensor(self, array, dtype=T.float):
+        tensor = T.as_tensor(np.ascontiguousarray(array), dtype=dtype)
+        return tensor.pin_memory() if self.pin else tensor
+
+    def run(self):
+        """
+        Keeps the queue full until stopped
+        """
+        while not self.stop.is_set():
+            if not self.memory.is_ready():
+                time.sleep(0.01)
+                continue
+
+            sample = self.memory.sample()
+            actor_states, states, actions, rewards, actor_new_states, states_, dones = sample[:7]
+            batch = [self.to_tensor(x) for x in (actor_states, states, actions, rewards, actor_new_states, states_)]
+            batch.insert(6, self.to_tensor(dones, dtype=T.bool))
+            if self.memory.prioritized: # Weights as a tensor, indices stay a numpy array for update_priorities
+                batch += [self.to_tensor(sample[7]), sample[8]]
+
+            while not self.stop.is_set():
+                try:
+                    self.batches.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def get(self):
+        """Takes the next batch, waiting if none are ready
+
+        Returns:
+            tuple: The batch in the format of memory.sample(), as tensors on the device
+        """
+        self.total_depth += self.batches.qsize()
+        start = time.perf_counter()
+        batch = self.batches.get()
+        self.stall_time += time.perf_counter() - start
+        self.n_batches += 1
+        return tuple(x.to(self.device, non_blocking=True) if isinstance(x, T.Tensor) else x for x in batch)
+
+    def stats(self, reset=True):
+        """Gives the metrics since the last reset
+
+        Args:
+            reset (bool, optional): Reset the metrics. Defaults to True.
+
+        Returns:
+            dict: Average queue depth when a batch was taken, total stall time in seconds, and batches taken
+        """
+        stats = {
+            'queue_depth': self.total_depth / max(1, self.n_batches),
+            'stall_time': self.stall_time,
+            'batches': self.n_batches
+        }
+        if reset:
+            self.n_batches = 0
+            self.total_depth = 0
+            self.stall_time = 0.0
+        return stats
+
+    def close(self):
+        """
+        Stops the sampling thread
+        """
+        self.stop.set()
+        self.thread.join()
@@ -0,0 +1,161 @@
+from maddpg.networks import ActorNetwork, CriticNetwork
+from maddpg.agent import soft_update
+from maddpg.team import Team
+from utils.noise import OUNoise
+import torch as T
+import os
+import numpy as np
+
+class SharedTeam(Team):
+    """
+    MADDPG team where every plane shares one actor and one critic
+    A one-hot agent ID is added to the inputs so the networks can still tell the planes apart,
+    and all agents go through the networks in a single batched forward pass
+    """
+    def __init__(self, agent_list, obs_size, n_actions, critic_dims, fc1_dims, fc2_dims, mem_size, batch_size, gamma, lr, chkpt_dir, mem_dir=None, prioritized=False, alpha=0.6, beta=0.4, beta_increment=0.0, debug=False, target_update_period=1, prefetch=0, keep_last=3, keep_every=10):
+        self.init_common(agent_list, n_actions, batch_size, chkpt_dir, False, debug, target_update_period, keep_last, keep_every) # SharedTeam.update is always a single pass
+        self.agents = {} # No per agent networks
+        self.n_agents = len(agent_list)
+        self.gamma = gamma
+        self.tau = 0.01
+
+        # Networks, saved as actor_shared, critic_shared, ... in the model folder
+        self.actor = ActorNetwork(obs_size + self.n_agents, n_actions, fc1_dims, fc2_dims, lr, chkpt_dir, 'actor_shared')
+        self.target_actor = ActorNetwork(obs_size + self.n_agents, n_actions, fc1_dims, fc2_dims, lr, chkpt_dir, 'target_actor_shared')
+        self.critic = CriticNetwork(obs_size, n_actions, self.n_agents, fc1_dims, fc2_dims, lr, chkpt_dir, 'critic_shared', id_dims=self.n_agents)
+        self.target_critic = CriticNetwork(obs_size, n_actions, self.n_agents, fc1_dims, fc2_dims, lr, chkpt_dir, 'target_critic_shared', id_dims=self.n_agents)
+        self.device = self.actor.device
+        self.ids = T.eye(self.n_agents, device=self.device) # One-hot agent IDs
+
+        self.params = [*self.actor.parameters(), *self.critic.parameters()]
+        self.target_params = [*self.target_actor.parameters(), *self.target_critic.parameters()]
+        soft_update(self.params, self.target_params, tau=1)
+
+        self.noise = OUNoise((1, self.n_agents, n_actions)) # Resized to (n_envs, n_agents, n_actions) when needed
+
+        self.init_memory(mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions, mem_dir, prioritized, alpha, beta, beta_increment, prefetch, self.device)
+
+    def act(self, actor, obs):
+        """Runs an actor on every agent at once
+
+        Args:
+            actor (ActorNetwork): The actor or target actor
+            obs (torch.tensor): [batch, n_agents, obs_size] observations
+
+        Returns:
+            torch.tensor: [batch, n_agents, n_actions] actions
+        """
+        ids = self.ids.expand(obs.shape[0], -1, -1)
+        return actor(T.cat([obs, ids], dim=-1))
+
+    def evaluate(self, critic, states, actions):
+        """Runs a critic for every agent at once
+
+        Args:
+            critic (CriticNetwork): The critic or target critic
+            states (torch.tensor): [batch, critic_dims] observations of all agents
+            actions (torch.tensor): [batch, n_agents * n_actions] actions of all agents
+
+        Returns:
+            torch.tensor: [n_agents, batch] Q-values of each agent
+        """
+        batch = states.shape[0]
+        states = states.unsqueeze(0).expand(self.n_agents, -1, -1)
+        actions = actions.unsqueeze(0).expand(self.n_agents, -1, -1)
+        ids = self.ids.unsqueeze(1).expand(-1, batch, -1)
+        return critic(states, actions, ids).squeeze(-1)
+
+    def choose_actions(self, observations):
+        obs = np.array([observations[agent] for agent in self.agent_list])
+        actions = self.choose_actions_batch(obs[None])[0]
+        return {agent: actions[idx] for idx, agent in enumerate(self.agent_list)}
+
+    def choose_actions_batch(self, observations):
+        """Chooses actions for the team in several games at once
+
+        Args:
+            observations (np.array): [n_envs, n_team, obs_size] observations in team order
+
+        Returns:
+            np.array: [n_envs, n_team, n_actions] actions
+        """
+        if self.noise.state.shape[0] != observations.shape[0]:
+            self.noise = OUNoise((observations.shape[0], self.n_agents, self.n_actions), scale=self.noise.scale)
+        with T.inference_mode():
+            obs = T.as_tensor(observations, dtype=T.float, device=self.device)
+            actions = self.act(self.actor, obs)
+            actions += T.as_tensor(self.noise.noise(), dtype=T.float, device=self.device) # Add noise
+            actions = actions.clamp(-1, 1) # Ensure between -1 and 1
+        return actions.cpu().numpy()
+
+    def update(self, sample):
+        """Updates the shared networks from a batch, the same update as Team.update_fused
+        The per-agent losses are summed, so the shared networks get the sum of every agent's gradient
+
+        Args:
+            sample (tuple): A batch in the format of memory.sample()
+
+        Returns:
+            np.array: Critic loss of each agent
+            np.array: Actor loss of each agent
+        """
+        device = self.device
+        actor_states, states, actions, rewards, actor_new_states, states_, dones = sample[:7]
+        actor_states = T.as_tensor(actor_states, dtype=T.float, device=device).transpose(0, 1) # [batch, n_agents, obs_size]
+        actor_new_states = T.as_tensor(actor_new_states, dtype=T.float, device=device).transpose(0, 1)
+        states = T.as_tensor(states, dtype=T.float, device=device)
+        states_ = T.as_tensor(states_, dtype=T.float, device=device)
+        rewards = T.as_tensor(rewards, dtype=T.float, device=device)
+        dones = T.as_tensor(dones, device=device)
+        old_actions = T.as_tensor(actions, dtype=T.float, device=device).transpose(0, 1).reshape(states.shape[0], -1) # [batch, n_agents*n_actions]
+
+        with T.autograd.set_detect_anomaly(self.debug):
+            # Targets for every agent
+            with T.no_grad():
+                new_actions = self.act(self.target_actor, actor_new_states).reshape(states.shape[0], -1)
+                critic_value_ = self.evaluate(self.target_critic, states_, new_actions)
+                critic_value_[:, dones[:,0]] = 0.0
+                targets = rewards.T + self.gamma*critic_value_
+
+            # Critic
+            critic_values = self.evaluate(self.critic, states, old_actions)
+            if self.memory.prioritized: # Importance sampling weights correct for the non-uniform sampling
+                weights = T.as_tensor(sample[7], dtype=T.float, device=device)
+                critic_losses = T.mean(weights * (targets - critic_values)**2, dim=1)
+            else:
+                critic_losses = T.mean((targets - critic_values)**2, dim=1)
+            self.critic.optimizer.zero_grad()
+            critic_losses.sum().backward()
+            self.critic.optimizer.step()
+
+            # Actor, through the updated critic
+            mu = self.act(self.actor, actor_states).reshape(states.shape[0], -1)
+            actor_losses = -T.mean(self.evaluate(self.critic, states, mu), dim=1)
+            self.actor.optimizer.zero_grad()
+            actor_losses.sum().backward()
+            self.actor.optimizer.step()
+        self.update_target_networks()
+
+        if self.memory.prioritized:
+            td_errors = T.abs(targets - critic_values.detach()).mean(dim=0)
+            self.memory.update_priorities(sample[8], td_errors.cpu().numpy())
+
+        return critic_losses.detach().cpu().numpy(), actor_losses.detach().cpu().numpy()
+
+    # Deal with noise
+    def scale_noise(self, scale):
+        self.noise.scale = scale
+
+    def reset_noise(self):
+        self.noise.reset()
+
+    # Networks and noise for checkpoints
+    def networks(self):
+        return {os.path.basename(network.checkpoint_file): network for network in (self.actor, self.target_actor, self.critic, self.target_critic)}
+
+    def noises(self):
+        return {'shared': self.noise}
+
+    def load_legacy(self):
+        for network in (self.actor, self.target_actor, self.critic, self.target_critic):
+            network.load_checkpoint()
@@ -1,17 +1,60 @@
-from maddpg.buffer import ReplayBuffer
+from maddpg.buffer import ReplayBuffer, PrioritizedReplayBuffer
 from maddpg.networks import CriticNetwork
-from maddpg.agent import NetworkedAgent
+from maddpg.agent import NetworkedAgent, soft_update
+from maddpg.prefetch import BatchPrefetcher
+from maddpg.checkpoint import Checkpointer, latest_checkpoint, load_file, restore
 import torch as T
 import torch.nn.functional as F
+import numpy as np
+import time
+import os
 
 class Team:
-    def __init__(self, agent_list, obs_size, n_actions, critic_dims, fc1_dims, fc2_dims, mem_size, batch_size, gamma, lr, chkpt_dir):
-        self.batch_size = batch_size
-        self.agent_list = agent_list # List of the string names of all agents in this team
+    def __init__(self, agent_list, obs_size, n_actions, critic_dims, fc1_dims, fc2_dims, mem_size, batch_size, gamma, lr, chkpt_dir, mem_dir=None, prioritized=False, alpha=0.6, beta=0.4, beta_increment=0.0, fused=False, debug=False, target_update_period=1, prefetch=0, keep_last=3, keep_every=10):
+        self.init_common(agent_list, n_actions, batch_size, chkpt_dir, fused, debug, target_update_period, keep_last, keep_every)
         self.agents = {}
         for idx, agent in enumerate(agent_list):
             self.agents[agent] = NetworkedAgent(agent_list, n_actions, obs_size, agent, len(agent_list), fc1_dims, fc2_dims, gamma, lr, chkpt_dir) # Create an agent for each agent in the team
-        self.memory = ReplayBuffer(mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions)
+
+        # Every agent's parameters in one list so the target networks update in a single pass
+        self.params = []
+        self.target_params = []
+        for agent in self.agents.values():
+            params, target_params = agent.network_pairs()
+            self.params += params
+            self.target_params += target_params
+        self.tau = self.agents[agent_list[0]].tau
+
+        self.init_memory(mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions, mem_dir, prioritized, alpha, beta, beta_increment, prefetch, self.agents[agent_list[0]].actor.device)
+
+    def init_common(self, agent_list, n_actions, batch_size, chkpt_dir, fused, debug, target_update_period, keep_last, keep_every):
+        # Settings, timers, and checkpointing shared by every kind of team, set before the networks are created
+        self.batch_size = batch_size
+        self.chkpt_dir = chkpt_dir
+        self.checkpointer = None # Started on the first save
+        self.keep_last = keep_last # Checkpoints to keep, see maddpg/checkpoint.py
+        self.keep_every = keep_every
+        self.fused = fused # Use update_fused instead of the original update
+        self.debug = debug # Autograd anomaly detection in the single pass updates
+        self.update_time = 0.0 # Wall time of the last update in seconds
+        self.total_update_time = 0.0
+        self.n_updates = 0
+        self.target_update_period = target_update_period # Updates between soft updates of the target networks
+        self.update_step = 0
+        self.agent_list = agent_list # List of the string names of all agents in this team
+        self.n_actions = n_actions
+
+    def init_memory(self, mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions, mem_dir, prioritized, alpha, beta, beta_increment, prefetch, device):
+        # Creates the replay buffer and the batch prefetcher
+        if prioritized: # Prioritized experience replay
+            self.memory = PrioritizedReplayBuffer(mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions, path=mem_dir, alpha=alpha, beta=beta, beta_increment=beta_increment)
+        else:
+            self.memory = ReplayBuffer(mem_size, batch_size, agent_list, obs_size, critic_dims, n_actions, path=mem_dir)
+
+        # Prepares batches in a background thread when prefetch > 0
+        self.prefetcher = None
+        if prefetch > 0:
+            self.prefetcher = BatchPrefetcher(self.memory, prefetch, device)
 
     def choose_actions(self, observations): # Call each agent's choose_action method
         actions = {}
@@ -19,22 +62,63 @@ class Team:
             actions[agent_id] = agent.choose_action(observations[agent_id])
         return actions
 
-    def learn(self):
-        if not self.memory.is_ready():
-            return
+    def choose_actions_batch(self, observations):
+        """Chooses actions for the team in several games at once
 
+        Args:
+            observations (np.array): [n_envs, n_team, obs_size] observations in team order
+
+        Returns:
+            np.array: [n_envs, n_team, n_actions] actions
+        """
+        actions = [agent.choose_actions_batch(observations[:, idx]) for idx, agent in enumerate(self.agents.values())]
+        return np.stack(actions, axis=1)
+
+    def learn(self, sample=None):
+        """Updates every agent's networks from a batch of the replay buffer
+
+        Args:
+            sample (tuple, optional): A batch in the format of memory.sample(), to compare updates on a fixed batch. Defaults to a new sample.
+
+        Returns:
+            np.array: Critic loss of each agent
+            np.array: Actor loss of each agent
+        """
+        if sample is None:
+            if not self.memory.is_ready():
+                return
+            sample = self.prefetcher.get() if self.prefetcher is not None else self.memory.sample()
+
+        start = time.perf_counter()
+        if self.fused:
+            losses = self.update_fused(sample)
+        else:
+            losses = self.update(sample)
+        self.update_time = time.perf_counter() - start
+        self.total_update_time += self.update_time
+        self.n_updates += 1
+        return losses
+
+    def update(self, sample):
         T.autograd.set_detect_anomaly(True)
 
         device = self.agents[self.agent_list[0]].actor.device
 
-        actor_states, states, actions, rewards, actor_new_states, states_, dones = self.memory.sample()
+        if self.memory.prioritized:
+            actor_states, states, actions, rewards, actor_new_states, states_, dones, weights, batch = sample
+            weights = T.as_tensor(weights, dtype=T.float, device=device)
+            td_errors = np.zeros(self.batch_size) # Summed over the agents' critics to set the new priorities
+        else:
+            actor_states, states, actions, rewards, actor_new_states, states_, dones = sample
+        critic_losses = []
+        actor_losses = []
 
         # Turn all into tensors
-        states = T.tensor(states, dtype=T.float).to(device)
-        actions = T.tensor(actions, dtype=T.float).to(device)
-        rewards = T.tensor(rewards, dtype=T.float).to(device)
-        states_ = T.tensor(states_, dtype=T.float).to(device)
-        dones = T.tensor(dones).to(device)
+        states = T.as_tensor(states, dtype=T.float, device=device)
+        actions = T.as_tensor(actions, dtype=T.float, device=device)
+        rewards = T.as_tensor(rewards, dtype=T.float, device=device)
+        states_ = T.as_tensor(states_, dtype=T.float, device=device)
+        dones = T.as_tensor(dones, device=device)
 
         all_agents_new_actions = [] # Actions returned from the target actor when sent new_states
         all_agents_new_mu_actions = [] # Actions returned from the actor when sent new_states
@@ -43,11 +127,11 @@ class Team:
         # Gather all actions from all agents
         for idx, agent_id in enumerate(self.agent_list):
             agent = self.agents[agent_id]
-            new_states = T.tensor(actor_new_states[idx], dtype=T.float).to(device)
+            new_states = T.as_tensor(actor_new_states[idx], dtype=T.float, device=device)
             new_pi = agent.target_actor.forward(new_states)
             all_agents_new_actions.append(new_pi)
 
-            mu_states = T.tensor(actor_states[idx], dtype=T.float).to(device)
+            mu_states = T.as_tensor(actor_states[idx], dtype=T.float, device=device)
             pi = agent.actor.forward(mu_states)
             all_agents_new_mu_actions.append(pi)
 
@@ -70,7 +154,11 @@ class Team:
             critic_value = agent.critic.forward(states, old_actions).flatten()
 
             target = rewards[:,idx] + agent.gamma*critic_value_
-            critic_loss = F.mse_loss(target, critic_value)
+            if self.memory.prioritized: # Importance sampling weights correct for the non-uniform sampling
+                critic_loss = T.mean(weights * (target - critic_value)**2)
+                td_errors += T.abs(target - critic_value).detach().cpu().numpy()
+            else:
+                critic_loss = F.mse_loss(target, critic_value)
             agent.critic.optimizer.zero_grad()
             critic_loss.backward(retain_graph=True)
             agent.critic.optimizer.step()
@@ -79,11 +167,96 @@ class Team:
             actor_loss = -T.mean(actor_loss)
             actor_loss.backward(retain_graph=True)
 
+            critic_losses.append(critic_loss.item())
+            actor_losses.append(actor_loss.item())
+
         # Step the actor optimizers and update the target networks
         for idx, agent_id in enumerate(self.agent_list):
             self.agents[agent_id].actor.optimizer.step()
-            self.agents[agent_id].update_network_parameters()
+        self.update_target_networks()
+
+        if self.memory.prioritized:
+            self.memory.update_priorities(batch, td_errors / len(self.agent_list))
+
+        return np.array(critic_losses), np.array(actor_losses)
+
+    def update_fused(self, sample):
+        """The same update as update(), without retained graphs
+
+        The targets for every agent come from one no_grad pass, and the summed critic
+        losses and summed actor losses each take a single backward pass. The critics
+        don't share parameters, so every critic still gets exactly its own gradient,
+        and every actor gets the sum of the gradients from all of the actor losses,
+        as in update().
+
+        Args:
+            sample (tuple): A batch in the format of memory.sample()
+
+        Returns:
+            np.array: Critic loss of each agent
+            np.array: Actor loss of each agent
+        """
+        agents = [self.agents[agent_id] for agent_id in self.agent_list]
+        device = agents[0].actor.device
+
+        actor_states, states, actions, rewards, actor_new_states, states_, dones = sample[:7]
+        actor_states = T.as_tensor(actor_states, dtype=T.float, device=device)
+        actor_new_states = T.as_tensor(actor_new_states, dtype=T.float, device=device)
+        states = T.as_tensor(states, dtype=T.float, device=device)
+        states_ = T.as_tensor(states_, dtype=T.float, device=device)
+        rewards = T.as_tensor(rewards, dtype=T.float, device=device)
+        dones = T.as_tensor(dones, device=device)
+        old_actions = T.as_tensor(actions, dtype=T.float, device=device).transpose(0, 1).reshape(states.shape[0], -1) # [batch, n_agents*n_actions]
+        if self.memory.prioritized:
+            weights = T.as_tensor(sample[7], dtype=T.float, device=device)
+
+        with T.autograd.set_detect_anomaly(self.debug):
+            # Targets for every critic
+            with T.no_grad():
+                new_actions = T.cat([agent.target_actor(actor_new_states[idx]) for idx, agent in enumerate(agents)], dim=1)
+                targets = []
+                for idx, agent in enumerate(agents):
+                    critic_value_ = agent.target_critic(states_, new_actions).flatten()
+                    critic_value_[dones[:,0]] = 0.0
+                    targets.append(rewards[:,idx] + agent.gamma*critic_value_)
+                targets = T.stack(targets)
+
+            # Critics
+            critic_values = T.stack([agent.critic(states, old_actions).flatten() for agent in agents])
+            if self.memory.prioritized: # Importance sampling weights correct for the non-uniform sampling
+                critic_losses = T.mean(weights * (targets - critic_values)**2, dim=1)
+            else:
+                critic_losses = T.mean((targets - critic_values)**2, dim=1)
+            for agent in agents:
+                agent.critic.optimizer.zero_grad()
+            critic_losses.sum().backward()
+            for agent in agents:
+                agent.critic.optimizer.step()
+
+            # Actors, through the updated critics
+            mu = T.cat([agent.actor(actor_states[idx]) for idx, agent in enumerate(agents)], dim=1)
+            actor_losses = T.stack([-T.mean(agent.critic(states, mu).flatten()) for agent in agents])
+            for agent in agents:
+                agent.actor.optimizer.zero_grad()
+            actor_losses.sum().backward()
+            for agent in agents:
+                agent.actor.optimizer.step()
+        self.update_target_networks()
+
+        if self.memory.prioritized:
+            td_errors = T.abs(targets - critic_values.detach()).mean(dim=0)
+            self.memory.update_priorities(sample[8], td_errors.cpu().numpy())
+
+        return critic_losses.detach().cpu().numpy(), actor_losses.detach().cpu().numpy()
     
+    def update_target_networks(self):
+        """
+        Soft updates every agent's target networks in place, once every target_update_period updates
+        """
+        self.update_step += 1
+        if self.update_step % self.target_update_period == 0:
+            soft_update(self.params, self.target_params, self.tau)
+
     # Deal with noise
     def scale_noise(self, scale):
         for agent in self.agents.values():
@@ -94,10 +267,61 @@ class Team:
             agent.reset_noise()
 
     # Save and load all agent models
-    def save_models(self):
+    def networks(self):
+        """
+        Returns every network of the team keyed by its file name
+        """
+        networks = {}
         for agent in self.agents.values():
-            agent.save_models()
+            for network in (agent.actor, agent.target_actor, agent.critic, agent.target_critic):
+                networks[os.path.basename(network.checkpoint_file)] = network
+        return networks
+
+    def noises(self):
+        """
+        Returns every noise process of the team keyed by name
+        """
+        noises = {}
+        for agent_id, agent in self.agents.items():
+            noises[agent_id] = agent.noise
+            if agent.batch_noise is not None:
+                noises[f'{agent_id}_batch'] = agent.batch_noise
+        return noises
+
+    def save_models(self, params=None):
+        """Writes a checkpoint of the networks, optimizers, noise and random states in the background
+
+        Args:
+            params (dict, optional): Training params to store with the checkpoint. Defaults to None.
+        """
+        if self.checkpointer is None:
+            self.checkpointer = Checkpointer(self.chkpt_dir, self.keep_last, self.keep_every)
+        self.checkpointer.save(self, params)
 
     def load_models(self):
+        """Loads the newest checkpoint, or the per-network files of older models
+
+        Returns:
+            dict: The params stored with the checkpoint, None for per-network files
+        """
+        path = latest_checkpoint(self.chkpt_dir)
+        if path is None:
+            self.load_legacy()
+            return None
+        return restore(self, load_file(path))
+
+    def load_legacy(self):
+        # Models saved before checkpoints have a file for each network
         for agent in self.agents.values():
-            agent.load_models()
\ No newline at end of file
+            agent.load_models()
+
+    def close(self):
+        """
+        Finishes writing checkpoints and stops the background threads
+        """
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+            self.checkpointer = None
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
\ No newline at end of file
@@ -0,0 +1,104 @@
+import collections
+import numpy as np
+from envs.subproc_env import SubprocBattleEnv
+
+# Plays n_envs games at once, one game per worker process (envs/subproc_env.py), and steps them together:
+# every step is one batched action choice for each team across all the games, one step of all the worker
+# processes, and one store of all the transitions. Finished games restart right away so the batch stays full.
+
+class VecTrainer:
+    """
+    Trains a maddpg Team in this process from games stepped together in a SubprocBattleEnv
+    """
+    def __init__(self, team, env_config, n_envs, utd_ratio, seed=None):
+        """Starts the worker processes
+
+        Args:
+            team (maddpg.Team or SharedTeam): The team to train
+            env_config (dict): Keyword arguments for battle_env.parallel_env
+            n_envs (int): Number of games (and worker processes)
+            utd_ratio (float): Updates per environment step (1 / learn_interval matches the synchronous loop)
+            seed (int, optional): Seed of the games, see SubprocBattleEnv. Defaults to a seed from the OS.
+        """
+        import instinct.team as instinct
+        self.team = team
+        self.utd_ratio = utd_ratio
+        self.env_steps = 0 # Transitions stored
+        self.n_updates = 0
+        self.results = collections.deque() # Finished games that haven't been handed out
+
+        self.env = SubprocBattleEnv(n_envs, env_config, seed=seed)
+        self.n_red = len(self.env.possible_red)
+        self.blue_team = instinct.Team(self.env.possible_blue, self.env.possible_red, self.env)
+        self.observations = self.env.reset()
+
+        # Running totals of the game in each env
+        self.red_score = np.zeros(n_envs)
+        self.blue_score = np.zeros(n_envs)
+        self.n_steps = np.zeros(n_envs, dtype=np.int64)
+
+    def set_noise(self, scale):
+        """Sets the exploration noise scale
+
+        Args:
+            scale (float): Noise scale
+        """
+        self.team.scale_noise(scale)
+
+    def next_game(self):
+        """Plays and trains until a game finishes
+
+        Returns:
+            float: Red team score
+            float: Blue team score
+            string: Winner, 'red', 'blue', or 'tie'
+            int: Number of steps in the game
+        """
+        while not self.results:
+            self.step()
+        return self.results.popleft()
+
+    def step(self):
+        """
+        Takes a step in every game, stores the transitions, and runs the updates that are due
+        """
+        n_red = self.n_red
+        observations = self.observations # Stays valid for one more step, see SubprocBattleEnv
+
+        # Red actions from the team's actors, blue actions from the instinct agents, each in one batch
+        red_actions = self.team.choose_actions_batch(observations[:, :n_red])
+        blue_actions = self.blue_team.choose_actions_batch(observations[:, n_red:])
+        if self.env.continuous_actions:
+            actions = np.concatenate([red_actions, blue_actions], axis=1)
+        else:
+            actions = np.concatenate([np.argmax(red_actions, axis=2), blue_actions], axis=1)
+
+        observations_, rewards, dones, env_done = self.env.step(actions)
+
+        # Finished games were reset, their transitions end on the last observations of the game
+        new_observations = observations_[:, :n_red].copy()
+        new_observations[env_done] = self.env.final_obs[env_done, :n_red]
+        self.team.memory.store_batch(observations[:, :n_red], red_actions, rewards[:, :n_red], new_observations, dones[:, :n_red])
+        self.env_steps += len(actions)
+
+        self.red_score += rewards[:, :n_red].sum(axis=1)
+        self.blue_score += rewards[:, n_red:].sum(axis=1)
+        self.n_steps += 1
+        if env_done.any():
+            winners = self.env.winners()
+            for idx in np.flatnonzero(env_done):
+                self.results.append((self.red_score[idx], self.blue_score[idx], winners[idx], int(self.n_steps[idx])))
+                self.red_score[idx] = 0
+                self.blue_score[idx] = 0
+                self.n_steps[idx] = 0
+        self.observations = observations_
+
+        while self.team.memory.is_ready() and self.n_updates < self.env_steps * self.utd_ratio:
+            self.team.learn()
+            self.n_updates += 1
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        self.env.close()
@@ -1,6 +1,10 @@
 import envs.battle_env as battle_env
 import maddpg.team as maddpg
+import maddpg.async_train as async_train
+import maddpg.vec_train as vec_train
+import maddpg.shared_team as shared_team
 import instinct.team as instinct
+from utils.episode_log import EpisodeLog, import_scores
 import numpy as np
 import os
 import datetime
@@ -22,7 +26,21 @@ params = {
     'print_interval': 100,
     'save_interval': 1000,
     'learn_interval': 100,
+    'prioritized': False, # Prioritized experience replay
+    'per_alpha': 0.6, # How strongly priorities skew sampling
+    'per_beta': 0.4, # Starting importance sampling correction
+    'per_beta_increment': 1e-5, # Growth of the correction per learning step, up to 1
+    'fused_learn': False, # Use the fused update (same losses, no retained graphs)
+    'debug': False, # Autograd anomaly detection in the fused update
+    'target_update_period': 1, # Learning steps between soft updates of the target networks
+    'n_workers': 0, # Rollout worker processes, 0 plays and learns in this process
+    'n_envs': 0, # Games stepped together in worker processes with batched actions (when n_workers is 0), 0 plays one game at a time
+    'utd_ratio': 0.01, # Updates per environment step with rollout workers
+    'publish_interval': 1, # Updates between sending new actor weights to the rollout workers
+    'prefetch': 0, # Batches sampled ahead in a background thread, 0 samples in learn()
+    'shared_networks': False, # All red planes share one actor and one critic
     'render_interval': 500,
+    'save_trajectories': False, # Save the render_interval games as trajectories for replay.py instead of recording videos
     'n_games': 500_000,
     'curr_game': 1
 }
@@ -39,11 +57,6 @@ env_config = {
     'continuous_actions': False
 }
 
-score_dict = {
-    "red": [],
-    "blue": []
-}
-
 def merge_dicts(dict1, dict2):
     dict2.update(dict1)
     return dict2
@@ -83,13 +96,15 @@ if __name__ == '__main__':
             print('Model does not exist')
             sys.exit()
             
-        # Load params and env_config and scores
+        # Load params and env_config
         with open(f'{FOLDER}/params.json', 'r') as f:
             params = json.load(f)
         with open(f'{FOLDER}/cf.json', 'r') as f:
             env_config = json.load(f)
-        with open(f'{FOLDER}/scores.json', 'r') as f:
-            score_dict = json.load(f)
+
+        # Models from before the episode log have their scores in scores.json
+        if not os.path.exists(f'{FOLDER}/episodes.log') and os.path.exists(f'{FOLDER}/scores.json'):
+            print(f"Imported {import_scores(f'{FOLDER}/scores.json', f'{FOLDER}/episodes.log')} games from scores.json")
 
         # Save params and env_config
         save_dict(FOLDER + '/params.json', params)
@@ -108,7 +123,13 @@ if __name__ == '__main__':
         save_dict(FOLDER + '/params.json', params)
         save_dict(FOLDER + '/cf.json', env_config)
         
-    env = battle_env.parallel_env(**env_config)
+    # Recorded games are drawn offscreen at full speed, unless the game is shown in a window anyway
+    env = battle_env.parallel_env(**env_config, render_mode='human' if env_config['show'] else 'offscreen')
+    episode_log = EpisodeLog(f'{FOLDER}/episodes.log') # Scores of every game
+    if choice == '2': # Games played after the last save are played again, so the log matches params['curr_game']
+        n_dropped = episode_log.truncate(params['curr_game'] - 1)
+        if n_dropped > 0:
+            print(f'Dropped {n_dropped} games played after the last save from the episode log')
 
     red_agent_list = env.possible_red
     blue_agent_list = env.possible_blue
@@ -116,7 +137,20 @@ if __name__ == '__main__':
     critic_dims = obs_len * env.n_agents
 
     # Red team is the maddpg team
-    red_team = maddpg.Team(red_agent_list, obs_len, env.n_actions, critic_dims, params['fc1_dims'], params['fc2_dims'], params['buffer_size'], params['batch_size'], params['gamma'], params['lr'], FOLDER)
+    team_config = {
+        'mem_dir': f'{FOLDER}/replay',
+        'prioritized': params.get('prioritized', False),
+        'alpha': params.get('per_alpha', 0.6),
+        'beta': params.get('per_beta', 0.4),
+        'beta_increment': params.get('per_beta_increment', 0.0),
+        'debug': params.get('debug', False),
+        'target_update_period': params.get('target_update_period', 1),
+        'prefetch': params.get('prefetch', 0)
+    }
+    if params.get('shared_networks', False): # One actor and critic for every plane
+        red_team = shared_team.SharedTeam(red_agent_list, obs_len, env.n_actions, critic_dims, params['fc1_dims'], params['fc2_dims'], params['buffer_size'], params['batch_size'], params['gamma'], params['lr'], FOLDER, **team_config)
+    else:
+        red_team = maddpg.Team(red_agent_list, obs_len, env.n_actions, critic_dims, params['fc1_dims'], params['fc2_dims'], params['buffer_size'], params['batch_size'], params['gamma'], params['lr'], FOLDER, fused=params.get('fused_learn', False), **team_config)
     
     # Blue team is the instinct agent team
     blue_team = instinct.Team(blue_agent_list, red_agent_list, env)
@@ -124,6 +158,16 @@ if __name__ == '__main__':
     if choice == '2': # Continue training a model
         red_team.load_models() # Load the models from the folder
 
+    print(f'Replay buffer: {red_team.memory.nbytes() / 1024**3:.2f} GB, {min(red_team.memory.mem_cntr, red_team.memory.mem_size)} transitions')
+
+    # Rollout workers with copies of the actors, the networks and replay buffer stay in this process
+    trainer = None
+    if params.get('n_workers', 0) > 0:
+        seed = int.from_bytes(os.urandom(4), 'little') >> 1 # New worker seeds on every run and every resume
+        trainer = async_train.AsyncTrainer(red_team, env_config, params['n_workers'], params.get('utd_ratio', 1 / params['learn_interval']), params.get('publish_interval', 1), seed=seed)
+    elif params.get('n_envs', 0) > 0: # Several games at once, one worker process each, stepped together from this process
+        trainer = vec_train.VecTrainer(red_team, env_config, params['n_envs'], params.get('utd_ratio', 1 / params['learn_interval']))
+
     print(f'\n{" Starting Training ":=^43}')
 
     start = datetime.datetime.now() # Capture the starting time
@@ -145,86 +189,79 @@ if __name__ == '__main__':
         estimate = (elapsed.total_seconds() / (i-start_game) * (params['n_games']-i)) / 3600
         sys.stdout.write(f"\r{' Game {game} | %{percent:.1f} | {estimate:.1f} Hours Left '.format(game=i, percent=i/params['n_games']*100, estimate=estimate):=^43}") # Will overwrite the previous line
         
-        observations = env.reset() # Reset the environment
-
         # Reset noise for exploration of maddpg
         explore_remaining = max(0, params['n_explores'] - i) / params['n_explores']
         params['curr_noise'] = params['init_noise'] + (params['init_noise'] - params['final_noise']) * explore_remaining
         params['curr_noise'] = round(params['curr_noise'], 2)
-        red_team.scale_noise(params['curr_noise'])
-        red_team.reset_noise()
 
-        red_score = 0
-        blue_score = 0
-        red_obs = {}
-        blue_obs = {}
-        
-        # Organize all the observations by team
-        for agent in red_agent_list:
-            red_obs[agent] = observations[agent]
-        for agent in blue_agent_list:
-            blue_obs[agent] = observations[agent]
-
-        if i % params['render_interval'] == 0 and i > 0:
-            env.show = True
-            env.start_recording(f'{FOLDER}/training_vids/{i}.mp4') # Record the video of 1 game
-
-        elif env.show == True:
-            env.export_video() # Stop recording video
-            env.show = False
-            env.close()
-
-        # Play the game
-        while not env.env_done:
-            actions = merge_dicts(red_team.choose_actions(red_obs), blue_team.choose_actions(blue_obs)) # Put together actions from both teams
-
-            observations_, rewards, dones, _ = env.step(actions)
-
-            red_obs_ = {}
-            red_actions = {}
-            red_rewards = {}
-            red_dones = {}
-            blue_obs_ = {}
-            blue_actions = {}
-            blue_rewards = {}
-            blue_dones = {}
-
-            # Organize all every return by team
-            for agent in red_agent_list:
-                red_obs_[agent] = observations_[agent]
-                red_actions[agent] = actions[agent]
-                red_rewards[agent] = rewards[agent]
-                red_score += rewards[agent]
-                red_dones[agent] = dones[agent]
-
-            for agent in blue_agent_list:
-                blue_obs_[agent] = observations_[agent]
-                blue_score += rewards[agent]
-
-            # Store the transitions in the replay buffer
-            red_team.memory.store_transition(red_obs, red_actions, red_rewards, red_obs_, red_dones)
-
-            # Learn from the replay buffer
-            if steps % params['learn_interval'] == 0 and steps > 0:
-                red_team.learn()
-
-            red_obs = red_obs_
-            blue_obs = blue_obs_
-            steps += 1
-            
+        if trainer is not None: # The worker processes play the games while this process learns
+            trainer.set_noise(params['curr_noise'])
+            red_score, blue_score, winner, n_steps = trainer.next_game()
+            steps += n_steps
+
+        else:
+            observations = env.reset_arrays() # Reset the environment
+
+            red_team.scale_noise(params['curr_noise'])
+            red_team.reset_noise()
+
+            red_score = 0
+            blue_score = 0
+            n_steps = 0
+            n_red = len(red_agent_list)
+
+            if i % params['render_interval'] == 0 and i > 0 and params.get('save_trajectories', False):
+                env.start_trajectory() # Record the game to render later with replay.py
+
+            elif i % params['render_interval'] == 0 and i > 0:
+                env.show = True
+                env.start_recording(f'{FOLDER}/training_vids/{i}.mp4') # Record the video of 1 game
+
+            elif env.show == True:
+                env.export_video() # Stop recording video
+                env.show = False
+                env.close()
+
+            # Play the game
+            while not env.env_done:
+                # The observation arrays are indexed like env.possible_agents, red planes first
+                red_action_arr = red_team.choose_actions_batch(observations[None, :n_red])[0]
+                red_actions = dict(zip(red_agent_list, red_action_arr))
+                blue_actions = blue_team.choose_actions(dict(zip(blue_agent_list, observations[n_red:])))
+                actions = env.to_array(merge_dicts(red_actions, blue_actions)) # Put together actions from both teams
+
+                observations_, rewards, dones = env.step_arrays(actions)
+                red_score += rewards[:n_red].sum()
+                blue_score += rewards[n_red:].sum()
+
+                # Store the transitions in the replay buffer
+                red_team.memory.store_arrays(observations[:n_red], red_action_arr, rewards[:n_red], observations_[:n_red], dones[:n_red])
+
+                # Learn from the replay buffer
+                if steps % params['learn_interval'] == 0 and steps > 0:
+                    red_team.learn()
+
+                observations = observations_
+                steps += 1
+                n_steps += 1
+
+            winner = env.winner
+            if env.trajectory is not None:
+                env.save_trajectory(f'{FOLDER}/trajectories/{i}.npz')
+
         # Game is done
 
         # Increment the winner
-        wins[env.winner] += 1
+        wins[winner] += 1
         
-        # Append scores
-        score_dict['red'].append(round(red_score, 3))
-        score_dict['blue'].append(round(blue_score, 3))
+        # Log the game
+        episode_log.append(red_score, blue_score, winner, n_steps)
 
         # Save the model and scores and params (params for the curr_game and exploration)
         if steps % params['save_interval'] == 0:
-            red_team.save_models()
-            save_dict(FOLDER + '/scores.json', score_dict)
+            red_team.save_models(params)
+            red_team.memory.save()
+            episode_log.sync()
             save_dict(FOLDER + '/params.json', params)
         
         # Print update
@@ -239,14 +276,21 @@ if __name__ == '__main__':
             formatted_time = now.strftime("%I:%M:%S %p")
 
             # Average the scores from the last {print_interval} games
-            avg_red = round(np.mean(score_dict['red'][-params['print_interval']:]), 3)
-            avg_blue = round(np.mean(score_dict['blue'][-params['print_interval']:]), 3)
+            recent = episode_log.tail(params['print_interval'])
+            avg_red = round(np.mean(recent['red']), 3)
+            avg_blue = round(np.mean(recent['blue']), 3)
 
             # Get the winrates from the last {print_interval} games
             red_winrate = round(wins['red']/params['print_interval'], 3)
             blue_winrate = round(wins['blue']/params['print_interval'], 3)
             tie_rate = round(wins['tie']/params['print_interval'], 3)
 
+            # Average wall time of the updates since the last print
+            update_ms = round(red_team.total_update_time / max(1, red_team.n_updates) * 1000, 2)
+            red_team.total_update_time = 0.0
+            red_team.n_updates = 0
+            prefetch_stats = red_team.prefetcher.stats() if red_team.prefetcher is not None else None
+
             # Reset the wins
             wins['red'] = 0
             wins['blue'] = 0
@@ -263,6 +307,17 @@ if __name__ == '__main__':
                 f"| {('Red Winrate: ' + str(red_winrate) + '%'):<40}|\n"
                 f"| {('Blue Winrate: ' + str(blue_winrate) + '%'):<40}|\n"
                 f"| {('Tie Rate: ' + str(tie_rate) + '%'):<40}|\n"
-                f"{'-'*43}\n"
+                f"| {('Update Time: ' + str(update_ms) + ' ms'):<40}|\n"
             )
-            print(statement)
\ No newline at end of file
+            if prefetch_stats is not None:
+                statement += (
+                    f"| {('Prefetch Depth: ' + str(round(prefetch_stats['queue_depth'], 2))):<40}|\n"
+                    f"| {('Sampler Stall: ' + str(round(prefetch_stats['stall_time'] * 1000, 1)) + ' ms'):<40}|\n"
+                )
+            statement += f"{'-'*43}\n"
+            print(statement)
+
+    if trainer is not None:
+        trainer.close()
+    red_team.close() # Finish writing the last checkpoint
+    episode_log.close()
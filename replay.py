@@ -0,0 +1,113 @@
+import envs.core as core
+from envs.trajectory import load_trajectory
+import multiprocessing as mp
+import os
+import sys
+import time
+
+# Turns trajectories saved during training (params['save_trajectories'] in main.py) into videos
+# Frames are drawn with the same sprites as a live render, offscreen, and every game is encoded in its own worker process
+
+class SpriteState(core.Body):
+    """
+    Plane or base read back from a trajectory, with what the sprites need to draw it
+    """
+    def __init__(self, team, w, h, id=None):
+        """Initializes the state
+
+        Args:
+            team (string): 'red' or 'blue'
+            w (int): Width of the sprite
+            h (int): Height of the sprite
+            id (string, optional): Name drawn under a plane. Defaults to None.
+        """
+        core.Body.__init__(self, w, h)
+        self.team = team
+        self.id = id
+        self.hp = 0
+        self.alive = True
+        self.direction = 0.0
+
+def render_trajectory(paths):
+    """Draws every frame of a trajectory and encodes it
+
+    Args:
+        paths (tuple): Path of the trajectory and path of the .mp4 to write
+
+    Returns:
+        string: Path of the video
+        int: Number of steps
+        float: Seconds it took
+    """
+    import pygame
+    import envs.sprites as sprites
+    from envs.recorder import VideoRecorder
+
+    start = time.perf_counter()
+    path, video_path = paths
+    trajectory = load_trajectory(path)
+    n_agents = int(trajectory['n_agents'])
+    fps = int(trajectory['fps'])
+    n_steps = len(trajectory['plane_xy']) - 1
+
+    pygame.font.init()
+    surface = pygame.Surface((core.DISP_WIDTH, core.DISP_HEIGHT), depth=32)
+    video = VideoRecorder(video_path, fps, (core.DISP_WIDTH, core.DISP_HEIGHT))
+
+    planes = [SpriteState(core.TEAMS[idx // n_agents], core.PLANE_W, core.PLANE_H, agent) for idx, agent in enumerate(trajectory['agents'])]
+    bases = [SpriteState(team, core.BASE_W, core.BASE_H) for team in core.TEAMS]
+    for base, xy in zip(bases, trajectory['base_xy']):
+        base.x, base.y = int(xy[0]), int(xy[1])
+    explosions = []
+    death_rank = {int(idx): rank for rank, idx in enumerate(trajectory['death_order'])}
+
+    # Frame t shows the state after step t, like rendering at the end of each step
+    for t in range(1, n_steps + 1):
+        died = [idx for idx, plane in enumerate(planes) if plane.alive and not trajectory['plane_alive'][t, idx]]
+        for idx, plane in enumerate(planes):
+            plane.x, plane.y = (int(v) for v in trajectory['plane_xy'][t, idx])
+            plane.direction = float(trajectory['plane_dir'][t, idx])
+            plane.hp = int(trajectory['plane_hp'][t, idx])
+            plane.alive = bool(trajectory['plane_alive'][t, idx])
+        for idx in sorted(died, key=death_rank.get): # Explosions of the planes that died this step, in the order they died
+            explosions.append(sprites.Explosion(planes[idx].get_pos()))
+        for base, hp in zip(bases, trajectory['base_hp'][t]):
+            base.hp = int(hp)
+
+        first, last = trajectory['bullet_offsets'][t], trajectory['bullet_offsets'][t + 1]
+        bullets = [(int(x), int(y), float(direction), core.TEAMS[team]) for (x, y), direction, team in zip(trajectory['bullet_xy'][first:last], trajectory['bullet_dir'][first:last], trajectory['bullet_team'][first:last])]
+        sprites.draw_scene(surface, bullets, explosions, bases, planes)
+
+        if t == n_steps: # Hold the winner on screen for about a second, like a live recording
+            sprites.draw_winner(surface, trajectory['winner'])
+            video.capture(surface, repeat=16 if fps <= 60 else 1)
+        else:
+            video.capture(surface)
+    video.close()
+    return video_path, n_steps, time.perf_counter() - start
+
+def main():
+    model_name = input('Enter model name: ')
+    FOLDER = f'models/{model_name}'
+    if not os.path.exists(f'{FOLDER}/trajectories'):
+        print('Model has no trajectories')
+        sys.exit()
+
+    available = sorted((name[:-len('.npz')] for name in os.listdir(f'{FOLDER}/trajectories') if name.endswith('.npz')), key=lambda name: (len(name), name))
+    print(f'{len(available)} trajectories: {" ".join(available)}')
+    chosen = input('Games to replay (blank for all): ').split() or available
+    missing = [name for name in chosen if name not in available]
+    if missing:
+        print(f'No trajectories for {" ".join(missing)}')
+        sys.exit()
+
+    os.makedirs(f'{FOLDER}/replay_vids', exist_ok=True)
+    jobs = [(f'{FOLDER}/trajectories/{name}.npz', f'{FOLDER}/replay_vids/{name}.mp4') for name in chosen]
+    start = time.perf_counter()
+    with mp.Pool(min(len(jobs), os.cpu_count())) as pool:
+        for video_path, n_steps, seconds in pool.imap_unordered(render_trajectory, jobs):
+            print(f'{video_path}: {n_steps} steps in {seconds:.1f} s')
+    print(f'Rendered {len(jobs)} videos in {time.perf_counter() - start:.1f} s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import numpy as np
+import json
+import os
+import time
+
+# Append-only log of finished games
+# The file is a 16 byte header followed by fixed-width records, so new games are appended without touching
+# the old ones, and the whole log can be read with a memory map no matter how many games it holds
+
+MAGIC = b'EPISODES'
+VERSION = 1
+HEADER_SIZE = 16
+RECORD = np.dtype([
+    ('red', '<f8'), # Red team score
+    ('blue', '<f8'), # Blue team score
+    ('time', '<f8'), # Unix time the game finished, nan if unknown
+    ('length', '<i4'), # Number of steps, -1 if unknown
+    ('winner', 'i1') # Index in WINNERS, -1 if unknown
+])
+WINNERS = ['red', 'blue', 'tie']
+
+def write_header(f):
+    f.write(MAGIC + np.array([VERSION, RECORD.itemsize], dtype='<u4').tobytes())
+
+def check_header(path):
+    """Checks that a file is an episode log this code can read
+
+    Args:
+        path (string): Path to the log
+    """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    version, itemsize = np.frombuffer(header[len(MAGIC):], dtype='<u4') if len(header) == HEADER_SIZE else (None, None)
+    if header[:len(MAGIC)] != MAGIC or version != VERSION or itemsize != RECORD.itemsize:
+        raise ValueError(f'{path} is not a version {VERSION} episode log')
+
+def read_log(path):
+    """Reads a log without loading it
+
+    Args:
+        path (string): Path to the log
+
+    Returns:
+        np.memmap: Read-only array of RECORD, fields can be taken like records['red']
+    """
+    check_header(path)
+    n_records = (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize # A partly written last record is ignored
+    if n_records == 0:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(n_records,))
+
+class EpisodeLog:
+    """
+    Appends finished games to a log file
+    """
+    def __init__(self, path):
+        """Opens the log for appending, creating it if needed
+
+        Args:
+            path (string): Path to the log
+        """
+        self.path = path
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                write_header(f)
+        check_header(path)
+
+        # Drop a record that was only partly written when a run crashed
+        self.n_records = (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize
+        with open(path, 'r+b') as f:
+            f.truncate(HEADER_SIZE + self.n_records * RECORD.itemsize)
+
+        self.file = open(path, 'ab')
+        self.record = np.zeros(1, dtype=RECORD)
+
+    def __len__(self):
+        return self.n_records
+
+    def append(self, red_score, blue_score, winner, length, timestamp=None):
+        """Adds a game to the end of the log
+        It is handed to the OS right away, so it survives the process crashing
+
+        Args:
+            red_score (float): Red team score
+            blue_score (float): Blue team score
+            winner (string): 'red', 'blue', or 'tie'
+            length (int): Number of steps
+            timestamp (float, optional): Unix time the game finished. Defaults to now.
+        """
+        record = self.record
+        record['red'] = red_score
+        record['blue'] = blue_score
+        record['time'] = time.time() if timestamp is None else timestamp
+        record['length'] = length
+        record['winner'] = WINNERS.index(winner) if winner in WINNERS else -1
+        self.file.write(record.tobytes())
+        self.file.flush()
+        self.n_records += 1
+
+    def truncate(self, n):
+        """Drops every game after the first n, e.g. games played after the last save of a run that crashed
+
+        Args:
+            n (int): Number of games to keep
+
+        Returns:
+            int: Number of games dropped
+        """
+        n_dropped = max(0, self.n_records - n)
+        if n_dropped > 0:
+            self.file.flush()
+            self.file.truncate(HEADER_SIZE + n * RECORD.itemsize)
+            self.n_records = n
+        return n_dropped
+
+    def sync(self):
+        """
+        Makes sure the log is on disk, not just handed to the OS
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def tail(self, n):
+        """Gets the last games
+
+        Args:
+            n (int): Number of games
+
+        Returns:
+            np.array: Copy of the last n records (fewer if the log is shorter)
+        """
+        return np.array(read_log(self.path)[-n:])
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+def import_scores(scores_path, path):
+    """Converts a scores.json file from older runs into an episode log
+    The old file only has the scores, so the winner, length, and time are left unknown
+
+    Args:
+        scores_path (string): Path to scores.json
+        path (string): Path of the new log, which must not exist yet
+
+    Returns:
+        int: Number of games imported
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} already exists')
+    with open(scores_path, 'r') as f:
+        score_dict = json.load(f)
+
+    records = np.zeros(len(score_dict['red']), dtype=RECORD)
+    records['red'] = score_dict['red']
+    records['blue'] = score_dict['blue']
+    records['time'] = np.nan
+    records['length'] = -1
+    records['winner'] = -1
+
+    # Written next to the log and renamed, so a crash never leaves half an import behind
+    with open(path + '.tmp', 'wb') as f:
+        write_header(f)
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+    return len(records)
+
+if __name__ == '__main__':
+    model_name = input('Which model to convert?: ')
+    FOLDER = f'models/{model_name}'
+    n_games = import_scores(f'{FOLDER}/scores.json', f'{FOLDER}/episodes.log')
+    print(f'Imported {n_games} games to {FOLDER}/episodes.log')
@@ -3,6 +3,7 @@ import numpy as np
 # from https://github.com/songrotek/DDPG/blob/master/ou_noise.py
 class OUNoise:
     def __init__(self, action_dimension, scale=0.1, mu=0, theta=0.15, sigma=0.2):
+        # action_dimension can also be a shape like (n_envs, n_actions), giving one independent process per row
         self.action_dimension = action_dimension
         self.scale = scale
         self.mu = mu
@@ -16,6 +17,6 @@ class OUNoise:
 
     def noise(self):
         x = self.state
-        dx = self.theta * (self.mu - x) + self.sigma * np.random.randn(len(x))
+        dx = self.theta * (self.mu - x) + self.sigma * np.random.randn(*x.shape)
         self.state = x + dx
         return self.state * self.scale
\ No newline at end of file
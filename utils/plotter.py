@@ -1,41 +1,211 @@
 import matplotlib.pyplot as plt
 import numpy as np
+import math
 import os
 import json
+from utils.episode_log import read_log
 
-def plot_scores(score_dict, filename):
-    fig, ax = plt.subplots()
-
-    print("Gathering data...")
-    red_y = np.array(score_dict['red'], dtype=np.float64)
-    blue_y = np.array(score_dict['blue'], dtype=np.float64)
-
-    red_avg = []
-    blue_avg = []
-    window = 1000
-    x = np.arange(0, len(red_y) - window + 1)
-    print("Gathering averages over 1000 games...")
-    for i in range(len(red_y) - window + 1):
-        red_avg.append(np.mean(red_y[i:i+window]))
-        blue_avg.append(np.mean(blue_y[i:i+window]))
-
-    # Plot raw averages
-    print("Plotting averages over 1000 games...")
-    plt.plot(x, red_avg, color='red', alpha=1, label='Red Team')
-    plt.plot(x, blue_avg, color='blue', alpha=1, label='Blue Team')
-
-    ax.set_title('Average score over time')
-    ax.set_xlabel('Number of games played')
+# Rolling statistics come from cumulative sums, so a window of any size costs the same per point,
+# and they are only computed at evenly spaced points (at most max_points of them), which is all a plot can show.
+# A PlotCache keeps the points between runs so only newly played games have to be read.
+
+STATS = ('red_mean', 'blue_mean', 'red_low', 'red_high', 'blue_low', 'blue_high', 'win_rate')
+
+def rolling_mean(values, window):
+    """Mean of every full window
+
+    Args:
+        values (np.array): The values
+        window (int): Window size
+
+    Returns:
+        np.array: [len(values) - window + 1] means, the first is of values[:window]
+    """
+    sums = np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+    return (sums[window:] - sums[:-window]) / window
+
+def window_stats(red, blue, winner, ends, window, band=(10, 90)):
+    """Statistics of the windows ending at the given games
+
+    Args:
+        red (np.array): Red team scores
+        blue (np.array): Blue team scores
+        winner (np.array): Winner of each game as in utils.episode_log.WINNERS, -1 if unknown
+        ends (np.array): Index of the last game of each window, at least window - 1
+        window (int): Window size
+        band (tuple, optional): Percentiles of the score bands. Defaults to (10, 90).
+
+    Returns:
+        dict: Array of each stat in STATS, win_rate is nan where no winner in the window is known
+    """
+    stats = {}
+    for team, scores in (('red', red), ('blue', blue)):
+        scores = np.asarray(scores, dtype=np.float64)
+        sums = np.concatenate([[0.0], np.cumsum(scores)])
+        stats[f'{team}_mean'] = (sums[ends + 1] - sums[ends + 1 - window]) / window
+        windows = np.lib.stride_tricks.sliding_window_view(scores, window)[ends + 1 - window]
+        stats[f'{team}_low'], stats[f'{team}_high'] = np.percentile(windows, band, axis=1)
+
+    # Win rate of red over the games with a known winner
+    wins = np.concatenate([[0], np.cumsum(winner == 0)])
+    known = np.concatenate([[0], np.cumsum(winner >= 0)])
+    n_known = known[ends + 1] - known[ends + 1 - window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['win_rate'] = np.where(n_known > 0, (wins[ends + 1] - wins[ends + 1 - window]) / n_known, np.nan)
+    return stats
+
+class PlotCache:
+    """
+    Plot points computed so far, extended with the new games on every update
+    """
+    def __init__(self, window=1000, max_points=1000):
+        """Starts an empty cache
+
+        Args:
+            window (int, optional): Games per rolling window. Defaults to 1000.
+            max_points (int, optional): Most points kept, about the width of the plot in pixels. Defaults to 1000.
+        """
+        self.window = window
+        self.max_points = max_points
+        self.stride = 1 # Games between points, doubled whenever there are too many points
+        self.x = np.zeros(0, dtype=np.int64) # Index of the last game of each point's window
+        self.stats = {stat: np.zeros(0) for stat in STATS}
+        self.last_game = np.zeros(0) # game_key of game x[-1], to notice when the games were replaced
+
+    @classmethod
+    def load(cls, path, window=1000, max_points=1000):
+        """Loads a saved cache, or starts a new one if there is none or it used another window
+
+        Args:
+            path (string): Path of the .npz file
+            window (int, optional): Games per rolling window. Defaults to 1000.
+            max_points (int, optional): Most points kept. Defaults to 1000.
+
+        Returns:
+            PlotCache: The cache
+        """
+        cache = cls(window, max_points)
+        if os.path.exists(path):
+            with np.load(path) as data:
+                if int(data['window']) == window and 'last_game' in data.files:
+                    cache.stride = int(data['stride'])
+                    cache.x = data['x']
+                    cache.stats = {stat: data[stat] for stat in STATS}
+                    cache.last_game = data['last_game']
+        return cache
+
+    def save(self, path):
+        np.savez(path, window=self.window, stride=self.stride, x=self.x, last_game=self.last_game, **self.stats)
+
+    def update(self, scores):
+        """Adds the points of newly played games
+
+        Args:
+            scores (dict or np.array): 'red' and 'blue' scores and optionally 'winner' (an episode log or the old scores dict)
+
+        Returns:
+            int: Number of new points
+        """
+        n_games = len(scores['red'])
+        if len(self.x) > 0 and (self.x[-1] >= n_games or not np.array_equal(game_key(scores, self.x[-1]), self.last_game, equal_nan=True)):
+            # The games under the points were replaced, e.g. dropped when a run resumed and played again, start over
+            self.__init__(self.window, self.max_points)
+        if len(self.x) == 0 and n_games >= self.window: # Pick a stride so the first pass is at most max_points
+            self.stride = 2**max(0, math.ceil(math.log2((n_games - self.window + 1) / self.max_points)))
+
+        # Windows end on every stride-th game
+        first = self.x[-1] + self.stride if len(self.x) > 0 else math.ceil(self.window / self.stride) * self.stride - 1
+        ends = np.arange(first, n_games, self.stride)
+        if len(ends) == 0:
+            return 0
+
+        # Only the games the new windows cover are read
+        start = ends[0] + 1 - self.window
+        red = np.asarray(scores['red'][start:n_games], dtype=np.float64)
+        blue = np.asarray(scores['blue'][start:n_games], dtype=np.float64)
+        winner = np.asarray(scores['winner'][start:n_games]) if 'winner' in fields(scores) else np.full(len(red), -1)
+        new = window_stats(red, blue, winner, ends - start, self.window)
+
+        self.x = np.concatenate([self.x, ends])
+        self.stats = {stat: np.concatenate([self.stats[stat], new[stat]]) for stat in STATS}
+
+        # Too many points, keep every other one
+        while len(self.x) > self.max_points:
+            self.stride *= 2
+            keep = (self.x + 1) % self.stride == 0
+            self.x = self.x[keep]
+            self.stats = {stat: values[keep] for stat, values in self.stats.items()}
+        self.last_game = game_key(scores, self.x[-1])
+        return len(ends)
+
+def game_key(scores, idx):
+    """
+    Every field of one game as floats, the time of a logged game tells a replayed game apart
+    """
+    return np.array([scores[field][idx] for field in fields(scores)], dtype=np.float64)
+
+def fields(scores):
+    """
+    Names available in an episode log array or a scores dict
+    """
+    return scores.dtype.names if isinstance(scores, np.ndarray) else scores.keys()
+
+def plot_scores(scores, filename, window=1000, max_points=1000, cache_path=None):
+    """Plots the rolling average scores with percentile bands, and the red win rate when winners are known
+
+    Args:
+        scores (dict or np.array): 'red' and 'blue' scores and optionally 'winner' (an episode log or the old scores dict)
+        filename (string): Where to save the figure
+        window (int, optional): Games per rolling window. Defaults to 1000.
+        max_points (int, optional): Most points plotted per line. Defaults to 1000.
+        cache_path (string, optional): Keeps the points in this file so the next plot only reads new games. Defaults to None.
+    """
+    cache = PlotCache.load(cache_path, window, max_points) if cache_path is not None else PlotCache(window, max_points)
+    print(f"Gathering averages over {window} games...")
+    n_new = cache.update(scores)
+    print(f"{n_new} new points, {len(cache.x)} points every {cache.stride} games")
+    if cache_path is not None:
+        cache.save(cache_path)
+
+    x = cache.x + 1 # Games played at the end of each window
+    stats = cache.stats
+    has_win_rate = len(x) > 0 and not np.all(np.isnan(stats['win_rate']))
+    if has_win_rate:
+        fig, (ax, win_ax) = plt.subplots(2, 1, sharex=True, figsize=(8, 7), gridspec_kw={'height_ratios': [2, 1]})
+    else:
+        fig, ax = plt.subplots()
+
+    # Averages with bands
+    print(f"Plotting averages over {window} games...")
+    ax.fill_between(x, stats['red_low'], stats['red_high'], color='red', alpha=0.15, linewidth=0)
+    ax.fill_between(x, stats['blue_low'], stats['blue_high'], color='blue', alpha=0.15, linewidth=0)
+    ax.plot(x, stats['red_mean'], color='red', alpha=1, label='Red Team')
+    ax.plot(x, stats['blue_mean'], color='blue', alpha=1, label='Blue Team')
+    ax.set_title('Average score over time (10th-90th percentile shaded)')
     ax.set_ylabel('Score')
     ax.grid()
     ax.legend()
+
+    if has_win_rate:
+        win_ax.plot(x, stats['win_rate'], color='red')
+        win_ax.set_ylabel('Red win rate')
+        win_ax.set_ylim(0, 1)
+        win_ax.grid()
+        win_ax.set_xlabel('Number of games played')
+    else:
+        ax.set_xlabel('Number of games played')
+
     fig.savefig(filename)
+    plt.close(fig)
     print("Finished plotting scores. Saved to", filename)
 
 if __name__ == '__main__':
     model_name = input("Which model to plot?: ")
-    scores_file = f'models/{model_name}/scores.json'
-    scores = {}
-    with open(scores_file, 'r') as f:
-        scores = json.load(f)
-    plot_scores(scores, f'models/{model_name}/plotted_scores.svg')
\ No newline at end of file
+    if os.path.exists(f'models/{model_name}/episodes.log'):
+        scores = read_log(f'models/{model_name}/episodes.log') # Records have 'red' and 'blue' fields like the old dict
+    else:
+        scores_file = f'models/{model_name}/scores.json'
+        scores = {}
+        with open(scores_file, 'r') as f:
+            scores = json.load(f)
+    plot_scores(scores, f'models/{model_name}/plotted_scores.svg', cache_path=f'models/{model_name}/plot_cache.npz')